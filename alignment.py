@@ -0,0 +1,147 @@
+import numpy as np
+
+import scoring
+
+
+def pose_descriptors(keypoints):
+    """Flattens a (T, 17, 2) keypoint track into (T, 34) unit-norm, mean-centered descriptors,
+    so the dot product of two descriptors is their cosine score."""
+    keypoints = np.asarray(keypoints, dtype=np.float64)
+    return scoring.normalize_poses(keypoints).reshape(len(keypoints), -1)
+
+
+def _standardize(signal):
+    signal = np.nan_to_num(np.asarray(signal, dtype=np.float64))
+    if signal.ndim == 1:
+        signal = signal[:, None]
+    signal = signal - signal.mean(axis=0)
+    std = signal.std(axis=0)
+    std[std == 0] = 1.
+    return signal / std
+
+
+def cross_correlation(signal_a, signal_b, max_lag):
+    """Normalized cross-correlation of two (T, d) signals for every lag in [-max_lag, max_lag].
+
+    `values[k]` is the mean over channels and overlapping frames of `a[t] * b[t + lags[k]]` after
+    standardizing each channel, so it stays around [-1, 1] regardless of how much the signals overlap.
+    Computed with one real FFT per signal: O((n + m) log(n + m)).
+    """
+    a = _standardize(signal_a)
+    b = _standardize(signal_b)
+    n, m = len(a), len(b)
+    size = 1
+    while size < n + m - 1:
+        size *= 2
+    spectrum = (np.conj(np.fft.rfft(a, size, axis=0)) * np.fft.rfft(b, size, axis=0)).sum(axis=1)
+    correlation = np.fft.irfft(spectrum, size)  # correlation[k] = sum_t a[t] b[t + k], k < 0 wrapped
+
+    lags = np.arange(-max_lag, max_lag + 1)
+    overlap = np.minimum(n, m - lags) - np.maximum(0, -lags)
+    values = correlation[lags % size] / (np.maximum(overlap, 1) * a.shape[1])
+    values[overlap <= 0] = 0.
+    return lags, values
+
+
+def estimate_offset(signal_pairs, max_lag):
+    """Estimates the constant lag between two recordings from one or more signal pairs.
+
+    `signal_pairs` is a list of `(signal_a, signal_b)` per-frame signals at a common frame rate
+    (pose descriptors, audio envelopes, ...); their normalized cross-correlations are averaged.
+    Returns `(lag, confidence)` where `signal_a[t]` best matches `signal_b[t + lag]` and
+    `confidence` is the averaged correlation at that lag.
+    """
+    total = None
+    for signal_a, signal_b in signal_pairs:
+        lags, values = cross_correlation(signal_a, signal_b, max_lag)
+        total = values if total is None else total + values
+    total /= len(signal_pairs)
+    best = int(np.argmax(total))
+    return int(lags[best]), float(total[best])
+
+
+def apply_offset(track_a, track_b, lag):
+    """Trims two per-frame arrays so that `track_a[t]` lines up with `track_b[t]` under `lag`
+    (as returned by `estimate_offset`), keeping only the overlapping frames."""
+    if lag > 0:
+        track_b = track_b[lag:]
+    elif lag < 0:
+        track_a = track_a[-lag:]
+    length = min(len(track_a), len(track_b))
+    return track_a[:length], track_b[:length]
+
+
+def dtw(desc_a, desc_b, window):
+    """Dynamic time warping of two descriptor sequences inside a Sakoe-Chiba band.
+
+    `desc_a` (n, d) and `desc_b` (m, d) are unit-norm descriptors; the cost of matching frame i
+    with frame j is `1 - desc_a[i] . desc_b[j]`. Only cells within `window` frames of the
+    (length-scaled) diagonal are evaluated, and each row is computed with array ops, so time is
+    O(n * window) and memory O(m + n * window) bytes for the back-pointers.
+
+    Returns the warping path as a (K, 2) array of (i, j) index pairs from (0, 0) to
+    (n - 1, m - 1) and the cosine score of every matched pair.
+    """
+    # a NaN cost would poison the running minimum; treat such frames as unmatched (cost 1)
+    desc_a = np.nan_to_num(np.asarray(desc_a, dtype=np.float64))
+    desc_b = np.nan_to_num(np.asarray(desc_b, dtype=np.float64))
+    n, m = len(desc_a), len(desc_b)
+    if n == 0 or m == 0:
+        return np.zeros((0, 2), dtype=np.int64), np.zeros(0)
+
+    # the band must at least cover the slope of the diagonal, or the end is unreachable
+    window = max(int(window), int(np.ceil(float(max(n, m)) / min(n, m))))
+    width = 2 * window + 1
+    centers = np.round(np.arange(n) * ((m - 1) / float(max(n - 1, 1)))).astype(np.int64)
+    lows = np.clip(centers - window, 0, m - 1)
+    highs = np.clip(centers + window, 0, m - 1)
+
+    # back-pointers: 0 = diagonal (i-1, j-1), 1 = up (i-1, j), 2 = left (i, j-1)
+    moves = np.zeros((n, width), dtype=np.int8)
+    prev = np.full(m + 2, np.inf)  # prev[j + 1] is D[i-1, j]; prev[0] stays inf
+    for i in range(n):
+        lo, hi = lows[i], highs[i] + 1
+        cost = 1. - desc_b[lo:hi].dot(desc_a[i])
+        if i == 0:
+            diag = np.full(hi - lo, np.inf)
+            up = np.full(hi - lo, np.inf)
+            if lo == 0:
+                diag[0] = 0.
+        else:
+            diag = prev[lo:hi]
+            up = prev[lo + 1:hi + 1]
+        from_above = np.minimum(diag, up)
+        best = cost + from_above
+        # D[j] = min(best[j], cost[j] + D[j-1]) unrolls to a running minimum over cumulative costs
+        cumulative = np.cumsum(cost)
+        row = cumulative + np.minimum.accumulate(best - cumulative)
+
+        row_moves = np.where(diag <= up, 0, 1).astype(np.int8)
+        row_moves[1:][cost[1:] + row[:-1] < best[1:]] = 2
+        moves[i, :hi - lo] = row_moves
+
+        if i > 0:
+            prev[lows[i - 1] + 1:highs[i - 1] + 2] = np.inf
+        prev[lo + 1:hi + 1] = row
+
+    path = []
+    i, j = n - 1, m - 1
+    while True:
+        path.append((i, j))
+        if i == 0 and j == 0:
+            break
+        move = moves[i, j - lows[i]]
+        if move == 0:
+            i, j = i - 1, j - 1
+        elif move == 1:
+            i -= 1
+        else:
+            j -= 1
+    path = np.array(path[::-1], dtype=np.int64)
+    scores = np.einsum('kd,kd->k', desc_a[path[:, 0]], desc_b[path[:, 1]])
+    return path, scores
+
+
+def align_poses(kp_a, kp_b, window):
+    """Warping path between two (T, 17, 2) keypoint tracks; see `dtw`."""
+    return dtw(pose_descriptors(kp_a), pose_descriptors(kp_b), window)
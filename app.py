@@ -4,22 +4,29 @@
 
 # Classic libraries
 import os
+import tempfile
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from numpy.linalg import norm
 import pandas as pd
 
 # Dash imports
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-from flask import render_template, request, redirect
-import imageio
+from flask import render_template, request, jsonify, url_for
+import alignment
 import image_demp
-import cv2
+import jobs
+import pipeline
+import pose_cache
+import results
+import scoring
+import video_io
 
-import matplotlib.pyplot as plt
 import matplotlib
 matplotlib.use('Agg')
+from matplotlib.figure import Figure
 
 
 # Custom function
@@ -34,11 +41,50 @@ def load_pickle(file_name):
 ############################## PARAMETERS and PRE-COMPUTATION ##############################
 ############################################################################################
 
-statte = [""]
-
 # Load pre computed data
 world = load_pickle('world_info.p')
 
+# Frames buffered between pipeline stages (bounds peak memory per request)
+FRAME_QUEUE_SIZE = 8
+
+# Video comparisons run as background jobs; their state is mirrored to JOB_DIR so any
+# gunicorn worker can answer status polls
+JOB_DIR = 'jobs'
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+
+# Per-job outputs (scores, overlay videos, plots), kept for RESULT_TTL seconds / RESULT_MAX_JOBS jobs
+RESULT_TTL = 24 * 3600
+RESULT_MAX_JOBS = 100
+result_store = results.ResultStore('static/results', ttl=RESULT_TTL, max_jobs=RESULT_MAX_JOBS)
+# job records carry the full result too: forgotten on the same schedule as the outputs
+job_queue = jobs.JobQueue(workers=JOB_WORKERS, state_dir=JOB_DIR, ttl=RESULT_TTL)
+
+# Temporal alignment before scoring: "dtw" warps the student's timing onto the reference
+# (within a +-ALIGN_WINDOW_SECONDS Sakoe-Chiba band), "none" pairs frame i with frame i
+ALIGN_NONE = 'none'
+ALIGN_DTW = 'dtw'
+ALIGN_MODES = (ALIGN_NONE, ALIGN_DTW)
+ALIGN_WINDOW_SECONDS = 3.0
+# Both videos are sampled at their common (lower) frame rate, and never faster than this:
+# poses barely change between frames above it, but every frame costs a PoseNet pass
+MAX_ANALYSIS_FPS = float(os.environ.get('MAX_ANALYSIS_FPS', 30))
+# Sparse inference: PoseNet on every k-th frame only, the poses in between interpolated;
+# "adaptive" also runs it whenever the picture changed by more than MOTION_THRESHOLD
+KEYFRAME_STRIDES = (1, 2, 3, 5)
+MOTION_THRESHOLD = 0.06
+# Input resolution preset (image_demp.PRESETS) when the upload doesn't pick one
+DEFAULT_PRESET = 'balanced'
+# How PoseNet runs (posenet.BACKENDS): "torchscript" is the frozen, CPU-optimized graph, with the
+# same outputs as the eager model to within float rounding
+image_demp.config.backend = os.environ.get('POSENET_BACKEND', 'torchscript')
+# Largest start offset (either direction) searched for before alignment
+MAX_OFFSET_SECONDS = 10.0
+
+# Per-frame PoseNet output of previously seen videos, keyed by content hash + model settings
+POSE_CACHE_DIR = 'cache/poses'
+POSE_CACHE_BYTES = 1 << 30
+keypoint_cache = pose_cache.PoseCache(POSE_CACHE_DIR, max_bytes=POSE_CACHE_BYTES)
+
 # Deployment inforamtion
 PORT = 8050
 
@@ -58,14 +104,158 @@ server.config["TEMPLATES_AUTO_RELOAD"] = True
 app.title = 'M(L)ove — AI Dance Coach'
 app.config.suppress_callback_exceptions = True
 
-score = []
+def _save_upload(storage):
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(storage.filename or "")[1] or ".mp4")
+    os.close(fd)
+    storage.save(path)
+    return path
+
+def _analyse(pairs, statte, digests, **inference):
+    # the two videos are independent: run both pose passes concurrently, each on its own
+    # thread with half of torch's thread budget (torch releases the GIL inside the model)
+    frames1, frames2 = pipeline.split(pairs, 2, FRAME_QUEUE_SIZE)
+    results1 = pipeline.buffered(image_demp.main(
+        frames1, statte, slot=0, pose_cache=keypoint_cache, video_digest=digests[0], **inference), FRAME_QUEUE_SIZE)
+    results2 = pipeline.buffered(image_demp.main(
+        frames2, statte, slot=1, pose_cache=keypoint_cache, video_digest=digests[1], **inference), FRAME_QUEUE_SIZE)
+    return zip(results1, results2)
+
+def _compare_videos(path1, path2, statte, out_dir, align=ALIGN_DTW, **inference):
+    """Decode -> pose inference -> encoding, streamed frame by frame, then alignment and scoring.
+
+    Every stage runs on its own thread behind a bounded queue, so peak memory does not grow
+    with the length of the videos. Progress is written to `statte`, overlay videos to `out_dir`.
+    With `align="dtw"` the keypoint tracks are time-warped onto each other before scoring.
+    `inference` options (`stride`, `motion_threshold`, `track`, `preset`) go to `image_demp.main`."""
+    video_r, video_r2, fps = video_io.open_pair(path1, path2, max_fps=MAX_ANALYSIS_FPS)
+    print(video_r.get_meta_data(), video_r2.get_meta_data(), "analysed at %g fps" % fps)
+
+    # the same reference video gets uploaded again and again: key its poses by content, and by
+    # the frame rate it was sampled at
+    digests = tuple("%s-%gfps" % (pose_cache.file_digest(p), fps) for p in (path1, path2))
+
+    print("analysing... ")
+    statte[0] = "analysing videos ... "
+    # split the CPU between the two videos' inference passes until both are done
+    with image_demp.parallel_streams(2):
+        pairs = video_io.paired_frames(video_r, video_r2, maxsize=FRAME_QUEUE_SIZE)
+        results = pipeline.chain(
+            pairs, lambda p: _analyse(p, statte, digests, **inference), maxsize=FRAME_QUEUE_SIZE)
+
+        # fan the results out: one ffmpeg encoder per output video, each on its own thread,
+        # while this thread collects the (small) keypoint tracks for scoring
+        streams = pipeline.split(
+            ((image1, image2, (pose1, pose2)) for (image1, *pose1), (image2, *pose2) in results), 3, FRAME_QUEUE_SIZE)
+        kp1, conf1, kp2, conf2 = [], [], [], []
+        try:
+            with ThreadPoolExecutor(max_workers=4) as encoders:
+                encoded1 = encoders.submit(video_io.encode, streams[0], os.path.join(out_dir, "out1.mp4"), fps)
+                encoded2 = encoders.submit(video_io.encode, streams[1], os.path.join(out_dir, "out2.mp4"), fps)
+                # audio onsets for the start-offset search, decoded alongside the video work
+                audio1 = encoders.submit(video_io.audio_envelope, path1, fps)
+                audio2 = encoders.submit(video_io.audio_envelope, path2, fps)
+                for (c1, s1), (c2, s2) in streams[2]:
+                    kp1.append(c1)
+                    conf1.append(s1)
+                    kp2.append(c2)
+                    conf2.append(s2)
+                # re-raise encoder failures
+                encoded1.result()
+                encoded2.result()
+                audio1 = audio1.result()
+                audio2 = audio2.result()
+        finally:
+            video_r.close()
+            video_r2.close()
+
+    kp1 = np.reshape(kp1, (-1, 17, 2))
+    kp2 = np.reshape(kp2, (-1, 17, 2))
+    conf1 = np.reshape(conf1, (-1, 17))
+    conf2 = np.reshape(conf2, (-1, 17))
+    statte[1] = ""
+
+    # recording started early/late: find the constant start offset first (FFT cross-correlation
+    # of pose descriptors and, when both videos have sound, audio onsets), then trim to overlap
+    lag = 0
+    if len(kp1) > 1:
+        signals = [(alignment.pose_descriptors(kp1), alignment.pose_descriptors(kp2))]
+        if audio1 is not None and audio2 is not None:
+            signals.append((audio1, audio2))
+        max_lag = min(int(MAX_OFFSET_SECONDS * fps), len(kp1) // 2)
+        lag, _ = alignment.estimate_offset(signals, max_lag)
+        kp1, kp2 = alignment.apply_offset(kp1, kp2, lag)
+        conf1, conf2 = alignment.apply_offset(conf1, conf2, lag)
+
+    if align == ALIGN_DTW:
+        print("aligning ... ")
+        statte[0] = "aligning ... "
+        path, _ = alignment.align_poses(kp1, kp2, window=int(round(ALIGN_WINDOW_SECONDS * fps)))
+        kp1, conf1 = kp1[path[:, 0]], conf1[path[:, 0]]
+        kp2, conf2 = kp2[path[:, 1]], conf2[path[:, 1]]
+
+    print("calculating dance score ... ")
+    statte[0] = "calculating dance score ... "
+    scores = scoring.score_poses(kp1, kp2, conf1, conf2)
+    scores["offset_seconds"] = lag / fps
+    print("done!")
+    statte[0] = "done!"
+
+    return scores
+
+def _run_comparison(job, path1, path2, align=ALIGN_DTW, **inference):
+    import posenet  # already loaded by the pose passes; kept off the worker's import path
+
+    result_store.cleanup()
+    job_queue.cleanup()
+    try:
+        scores = _compare_videos(path1, path2, job.progress, result_store.job_dir(job.id), align=align, **inference)
+    finally:
+        os.remove(path1)
+        os.remove(path2)
+
+    data_score = scores["cosine"]
+    a = list(range(len(data_score)))
+
+    # pyplot's global state isn't thread-safe, so draw on a standalone Figure
+    fig = Figure()
+    ax = fig.subplots()
+    ax.plot(a[:-1],data_score[:-1],a[1:],data_score[1:],linewidth=0.2)
+    ax.set_ylim((0,1.1))
+    fig.savefig(result_store.path(job.id, "score.png"))
+
+    with warnings.catch_warnings():
+        # frames without a pose are NaN; a joint never seen in both videos has no mean
+        warnings.simplefilter("ignore", RuntimeWarning)
+        joint_error = np.nanmean(scores["joint_errors"], axis=0)
+    result = {
+        "score": data_score,
+        "weighted_score": scores["weighted"],
+        "joint_error": dict(zip(posenet.PART_NAMES, joint_error)),
+        "offset_seconds": scores["offset_seconds"],
+    }
+    # written last: a job's results count as present once this file is
+    return result_store.save_result(job.id, result)
 
 @server.route('/view-video', methods = ["GET"])
 def view_video():
-    temp_score = [x*100 for x in score if x==x]
+    job_id = request.args.get("job", "")
+    result = result_store.load_result(job_id)
+    if result is None:
+        return "No results for this job (unknown, still running or expired).", 404
+    temp_score = [x*100 for x in result["score"] if x is not None]
     if temp_score==[]:
         temp_score = [0]
-    return render_template("public/view_video.html", value=sum(temp_score)/len(temp_score))
+    files = {name: result_store.url_path(job_id, name) for name in ("out1.mp4", "out2.mp4", "score.png")}
+    return render_template(
+        "public/view_video.html", value=sum(temp_score)/len(temp_score), files=files,
+        joint_error=result["joint_error"], offset=result["offset_seconds"])
+
+@server.route('/jobs/<job_id>', methods = ["GET"])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify(error="unknown job"), 404
+    return jsonify(job)
 
 @server.route('/upload-video', methods = ["GET", "POST"])
 def upload_video():
@@ -73,77 +263,31 @@ def upload_video():
     if request.method == "POST":
         if request.files:
 
-            video = request.files["video"].read()
-            video2 = request.files["video2"].read()
-            print(len(video))
-            video_r = imageio.get_reader(video,  'ffmpeg')
-            video_rm = video_r.get_meta_data()
-            video_r2 = imageio.get_reader(video2,  'ffmpeg')
-            video_rm2 = video_r2.get_meta_data()
-            # print(video_r.get_data(10))
-            print(video_rm)
-            temp = video_r
-            if video_rm["duration"] > video_rm2["duration"]:
-                temp = video_r2
-            data1 = []
-            data2 = []
-            print("reading... ")
-            statte[0] = "reading video ... "
-            for i, ii in enumerate(temp):
-                data1 += [ii]
-                data2 += [video_r2.get_data(i)]
-            print("analysing... ")
-            statte[0] = "analysing video 1 ... "
-            data_p1, data_ps1 = image_demp.main(data1, statte)
-            statte[0] = "analysing video 2 ... "
-            data_p2, data_ps2 = image_demp.main(data2, statte)
-            data_score = []
-            print("calculating dance score ... ")
-            statte[0] = "calculating dance score ... "
-            for i, ii in enumerate(temp):
-                if len(data_ps1[i])!=0 and len(data_ps2[i])!=0:
-                    da = data_ps1[i][:34]
-                    db = data_ps2[i][:34]
-                    data_score += [np.inner(da, db/(norm(da)*norm(db)))]
-            print("done!")
-            statte[0] = "done!"
-            print(np.array(data_ps2).shape)
-            print(np.array(data_score).shape)
-            
-            # video_out = cv2.VideoWriter("static/out1.mp4", cv2.VideoWriter_fourcc(*"mp4v"), 24, (video_rm["source_size"][0],video_rm["source_size"][1]))
-            # for image in data_p1:
-            #     video_out.write(image)
-
-            # video_out2 = cv2.VideoWriter("static/out2.mp4", cv2.VideoWriter_fourcc(*"mp4v"), 24, (video_rm2["source_size"][0],video_rm2["source_size"][1]))
-            # for image in data_p2:
-            #     video_out2.write(image)
-
-            video_out = cv2.VideoWriter("static/out1.avi", cv2.VideoWriter_fourcc(*"XVID"), 24, (video_rm["source_size"][0],video_rm["source_size"][1]))
-            for image in data_p1:
-                video_out.write(image)
-            video_out.release()
-            video_out2 = cv2.VideoWriter("static/out2.avi", cv2.VideoWriter_fourcc(*"XVID"), 24, (video_rm2["source_size"][0],video_rm2["source_size"][1]))
-            for image in data_p2:
-                video_out2.write(image)
-            video_out2.release()
-            
-            os.system("ffmpeg -y -i static/out1.avi static/out1.mp4")
-            os.system("ffmpeg -y -i static/out2.avi static/out2.mp4")
-            
-            score = data_score
-            
-            a = list(range(len(data_score)))
-
-            plt.plot(a[:-1],data_score[:-1],a[1:],data_score[1:],linewidth=0.2)
-            plt.ylim((0,1.1))
-            plt.savefig('static/score.png')
-            plt.close()
-            
-            # return redirect(request.url)
-            
-            return redirect("/view-video")
-
-    return render_template("public/upload_video.html", statte = statte)
+            align = request.form.get("align", ALIGN_DTW)
+            if align not in ALIGN_MODES:
+                return jsonify(error="align must be one of %s" % ", ".join(ALIGN_MODES)), 400
+            try:
+                stride = int(request.form.get("stride", 1))
+            except ValueError:
+                stride = None
+            if stride not in KEYFRAME_STRIDES:
+                return jsonify(error="stride must be one of %s" % ", ".join(map(str, KEYFRAME_STRIDES))), 400
+            motion_threshold = MOTION_THRESHOLD if request.form.get("adaptive") else None
+            track = bool(request.form.get("track"))
+            preset = request.form.get("preset", DEFAULT_PRESET)
+            if preset not in image_demp.PRESETS:
+                return jsonify(error="preset must be one of %s" % ", ".join(sorted(image_demp.PRESETS))), 400
+
+            # spool the uploads to disk so ffmpeg can stream them instead of holding both in RAM
+            path1 = _save_upload(request.files["video"])
+            path2 = _save_upload(request.files["video2"])
+            job = job_queue.submit(
+                _run_comparison, path1, path2, align=align,
+                stride=stride, motion_threshold=motion_threshold, track=track, preset=preset)
+
+            return jsonify(job_id=job.id, status_url=url_for("job_status", job_id=job.id)), 202
+
+    return render_template("public/upload_video.html")
 
 # def 
 
@@ -0,0 +1,758 @@
+"""Micro-benchmarks for the video comparison pipeline.
+
+    python benchmark.py startup
+    python benchmark.py decode --videos test.mp4 left.mp4 right.mp4
+    python benchmark.py resample --videos left.mp4 test.mp4 --fps 24 15
+    python benchmark.py convert --models 50 75 100 101
+    python benchmark.py preprocess --video test.mp4
+    python benchmark.py batch --video left.mp4 --batch_sizes 1 2 4 8
+    python benchmark.py backends --video test.mp4 --batch_size 1
+    python benchmark.py quantize --videos test.mp4 left.mp4 right.mp4
+    python benchmark.py poses --video test.mp4
+    python benchmark.py sparse --videos left.mp4 right.mp4 test.mp4 --strides 2 3 5
+    python benchmark.py track --videos test.mp4 left.mp4
+    python benchmark.py resolution --videos test.mp4 left.mp4
+    python benchmark.py parse --poses 10
+    python benchmark.py scoring --frames 100000
+    python benchmark.py dtw --minutes 10 --fps 30 --window 3
+    python benchmark.py offset --seconds 60 --max_offset 10 --lags 0 7 -13 45 -90 299
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import video_io
+
+
+def bench_startup(args):
+    import subprocess
+    import sys
+
+    # fresh interpreters, as a newly forked/spawned worker would be
+    code = ('import sys, time; start = time.time(); import %s; '
+            'print(time.time() - start, "torch" in sys.modules)')
+    for module in args.modules:
+        times = []
+        for _ in range(args.repeat):
+            out = subprocess.check_output([sys.executable, '-c', code % module], stderr=subprocess.DEVNULL)
+            elapsed, torch_loaded = out.split()[-2:]
+            times.append(float(elapsed))
+        print('import %-12s %6.3f s (best of %d), torch loaded: %s' % (
+            module, min(times), args.repeat, torch_loaded.decode()))
+
+
+def _random_access_pairs(video_r, video_r2):
+    # the original /upload-video read loop: iterate the shorter reader, seek the other per frame
+    if video_r.get_meta_data()['duration'] > video_r2.get_meta_data()['duration']:
+        video_r, video_r2 = video_r2, video_r
+    for i, frame in enumerate(video_r):
+        yield frame, video_r2.get_data(i)
+
+
+def bench_decode(args):
+    pairs = [(a, b) for a in args.videos for b in args.videos if a != b] or [(args.videos[0], args.videos[0])]
+    modes = [
+        ('get_data(i)', lambda r1, r2: _random_access_pairs(r1, r2)),
+        ('lockstep', lambda r1, r2: video_io.paired_frames(r1, r2, threaded=False)),
+        ('lockstep+threads', lambda r1, r2: video_io.paired_frames(r1, r2, threaded=True)),
+    ]
+    for path1, path2 in pairs:
+        for name, make in modes:
+            video_r = video_io.open_reader(path1)
+            video_r2 = video_io.open_reader(path2)
+            start = time.time()
+            count = sum(1 for _ in make(video_r, video_r2))
+            elapsed = time.time() - start
+            video_r.close()
+            video_r2.close()
+            print('%-10s %-10s %-18s %5d frames  %7.1f frames/s' % (
+                path1, path2, name, count, count / elapsed))
+
+
+def bench_resample(args):
+    # every frame that reaches Python costs one PoseNet pass downstream
+    for path in args.videos:
+        native = video_io.open_reader(path).get_meta_data()['fps']
+        for fps in [None] + args.fps:
+            video_r = video_io.open_reader(path, fps)
+            start = time.time()
+            count = sum(1 for _ in video_r)
+            elapsed = time.time() - start
+            video_r.close()
+            print('%-10s %6.2f -> %6.2f fps  %5d frames  decode %.2f s' % (
+                path, native, fps or native, count, elapsed))
+
+
+def _read_frames(path, limit):
+    video_r = video_io.open_reader(path)
+    frames = []
+    for frame in video_r:
+        frames.append(frame)
+        if len(frames) == limit:
+            break
+    video_r.close()
+    return frames
+
+
+def _process_input_reference(source_img, scale_factor=1.0, output_stride=16):
+    # posenet.utils._process_input before buffer reuse: five full-size temporaries per frame
+    import cv2
+    import numpy as np
+    import posenet
+
+    target_width, target_height = posenet.valid_resolution(
+        source_img.shape[1] * scale_factor, source_img.shape[0] * scale_factor, output_stride=output_stride)
+    input_img = cv2.resize(source_img, (target_width, target_height), interpolation=cv2.INTER_LINEAR)
+    input_img = cv2.cvtColor(input_img, cv2.COLOR_BGR2RGB).astype(np.float32)
+    input_img = input_img * (2.0 / 255.0) - 1.0
+    return input_img.transpose((2, 0, 1)).reshape(1, 3, target_height, target_width)
+
+
+def _load_variables_reference(chkpoint, base_dir):
+    # tfjs2pytorch.load_variables before np.frombuffer: struct.unpack into a tuple of Python floats
+    import json
+    import os
+    import struct
+    import numpy as np
+    import torch
+    from posenet.converter.tfjs2pytorch import to_torch_name
+
+    with open(os.path.join(base_dir, chkpoint, "manifest.json")) as manifest:
+        variables = json.load(manifest)
+    state_dict = {}
+    for x in variables:
+        torch_name = to_torch_name(x)
+        if not torch_name:
+            continue
+        filename = variables[x]["filename"]
+        byte = open(os.path.join(base_dir, chkpoint, filename), 'rb').read()
+        fmt = str(int(len(byte) / struct.calcsize('f'))) + 'f'
+        d = np.array(struct.unpack(fmt, byte), dtype=np.float32)
+        shape = variables[x]["shape"]
+        if len(shape) == 4:
+            tpt = (2, 3, 0, 1) if 'depthwise' in filename else (3, 2, 0, 1)
+            d = np.reshape(d, shape).transpose(tpt)
+        state_dict[torch_name] = torch.Tensor(d)
+    return state_dict
+
+
+def bench_convert(args):
+    import tracemalloc
+    import torch
+    from posenet import MOBILENET_V1_CHECKPOINTS
+    from posenet.converter.tfjs2pytorch import load_variables
+
+    modes = [
+        ('struct.unpack', lambda name: _load_variables_reference(name, args.base_dir)),
+        ('frombuffer', lambda name: load_variables(name, args.base_dir, workers=1)),
+        ('frombuffer x%d' % args.workers, lambda name: load_variables(name, args.base_dir, workers=args.workers)),
+    ]
+    for model_id in args.models:
+        name = MOBILENET_V1_CHECKPOINTS[model_id]
+        expected = _load_variables_reference(name, args.base_dir)
+        for mode, load in modes:
+            start = time.time()
+            state_dict = load(name)
+            elapsed = time.time() - start
+            assert sorted(state_dict) == sorted(expected)
+            assert all(torch.equal(state_dict[k], expected[k]) for k in expected), '%s diverged' % mode
+            # Python objects, bytes and numpy buffers are traced; torch's own copies are not
+            tracemalloc.start()
+            load(name)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print('%s  %-15s %7.1f ms  peak %6.1f MB' % (name, mode, 1000. * elapsed, peak / 1e6))
+
+
+def bench_preprocess(args):
+    import tracemalloc
+    import numpy as np
+    import torch
+    import posenet
+
+    frames = _read_frames(args.video, args.frames)
+    preprocessor = posenet.Preprocessor()
+    modes = [
+        ('copying', lambda f: torch.Tensor(_process_input_reference(f, args.scale_factor))),
+        ('_process_input', lambda f: torch.from_numpy(posenet.utils._process_input(f, args.scale_factor)[0])),
+        ('Preprocessor', lambda f: torch.from_numpy(preprocessor.process(f, args.scale_factor)[0])),
+    ]
+    for f in frames[:2]:
+        expected = _process_input_reference(f, args.scale_factor)
+        for name, run in modes:
+            assert np.array_equal(run(f).numpy(), expected), '%s diverged from the reference' % name
+    input_bytes = expected.nbytes
+    print('%s: %d frames, model input %s (%.1f MB float32)' % (
+        args.video, len(frames), 'x'.join(str(x) for x in expected.shape[2:]), input_bytes / 1e6))
+
+    for name, run in modes:
+        run(frames[0])
+        start = time.time()
+        for f in frames:
+            run(f)
+        elapsed = time.time() - start
+        # numpy/OpenCV buffers are visible to tracemalloc (torch's own allocator is not, so the
+        # copy torch.Tensor makes is counted separately)
+        tracemalloc.start()
+        peak = 0
+        for f in frames:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            tensor = run(f)
+            frame_peak = tracemalloc.get_traced_memory()[1]
+            peak = max(peak, frame_peak - before)
+            del tensor
+        tracemalloc.stop()
+        shares = name != 'copying'
+        print('%-15s %7.2f ms/frame  transient peak %6.1f MB (%.1f inputs)  torch copy: %s' % (
+            name, 1000. * elapsed / len(frames), peak / 1e6, peak / float(input_bytes), 'no' if shares else 'yes'))
+
+
+def bench_batch(args):
+    import numpy as np
+    import torch
+    import posenet
+
+    model = posenet.get_model(args.model)
+    frames = _read_frames(args.video, args.frames)
+    inputs = [posenet.utils._process_input(f, scale_factor=args.scale_factor)[0] for f in frames]
+    print('%s: %d frames at %s, %d torch threads' % (
+        args.video, len(inputs), 'x'.join(str(x) for x in inputs[0].shape[2:]), torch.get_num_threads()))
+    with torch.no_grad():
+        model(torch.Tensor(inputs[0]))
+        for batch_size in args.batch_sizes:
+            start = time.time()
+            for i in range(0, len(inputs), batch_size):
+                model(torch.Tensor(np.concatenate(inputs[i:i + batch_size])))
+            elapsed = time.time() - start
+            print('batch %3d  %7.1f frames/s' % (batch_size, len(inputs) / elapsed))
+
+
+def bench_backends(args):
+    import numpy as np
+    import torch
+    import posenet
+
+    frames = _read_frames(args.video, args.frames)
+    inputs = [posenet.utils._process_input(f, scale_factor=args.scale_factor)[0] for f in frames]
+    batches = [torch.from_numpy(np.concatenate(inputs[i:i + args.batch_size]))
+               for i in range(0, len(inputs), args.batch_size)]
+    print('%s: %d frames at %s, batch %d, %d torch threads' % (
+        args.video, len(inputs), 'x'.join(str(x) for x in inputs[0].shape[2:]), args.batch_size,
+        torch.get_num_threads()))
+
+    reference = None
+    for backend in args.backends:
+        start = time.time()
+        try:
+            model = posenet.get_model(args.model, backend=backend)
+        except ImportError as e:
+            print('%-12s skipped: %s' % (backend, e))
+            continue
+        load_time = time.time() - start
+        with torch.no_grad():
+            model(batches[0])
+            start = time.time()
+            outputs = [[r.numpy() for r in model(batch)] for batch in batches]
+            elapsed = time.time() - start
+        if reference is None:
+            reference = outputs
+        # every output of every frame against the first (eager) backend
+        worst = 0.
+        for expected, actual in zip(reference, outputs):
+            for name, e, a in zip(posenet.models.export.OUTPUT_NAMES, expected, actual):
+                assert e.shape == a.shape, '%s %s: shape %s, expected %s' % (backend, name, a.shape, e.shape)
+                assert np.allclose(a, e, rtol=args.tolerance, atol=args.tolerance), '%s %s diverged by %g' % (
+                    backend, name, np.abs(a - e).max())
+                worst = max(worst, float(np.abs(a - e).max()))
+        print('%-12s %8.1f ms/frame  load %6.2f s  max abs diff %.1e' % (
+            backend, 1000. * elapsed / len(inputs), load_time, worst))
+
+
+def bench_quantize(args):
+    import numpy as np
+    import torch
+    import image_demp
+    import posenet
+
+    fp32 = posenet.get_model(args.model)
+    start = time.time()
+    int8 = posenet.get_model(args.model, backend='int8')
+    print('int8 model ready in %.2f s (includes calibration on first use), engine %s, %d torch threads' % (
+        time.time() - start, torch.backends.quantized.engine, torch.get_num_threads()))
+
+    for path in args.videos:
+        frames = _read_frames(path, args.frames)
+        inputs = [posenet.utils._process_input(f, scale_factor=args.scale_factor)[0] for f in frames]
+        times = {}
+        poses = {}
+        for name, model in (('fp32', fp32), ('int8', int8)):
+            image_demp._decode(model, inputs[0])
+            start = time.time()
+            poses[name] = [image_demp._decode(model, input_image)[0] for input_image in inputs]
+            times[name] = time.time() - start
+
+        # keypoint drift of the top pose, over the joints fp32 is confident about
+        distances = []
+        score_drift = []
+        found = 0
+        for (s32, ks32, kc32), (s8, ks8, kc8) in zip(poses['fp32'], poses['int8']):
+            if s32[0] == 0.:
+                continue
+            found += s8[0] > 0.
+            score_drift.append(abs(s32[0] - s8[0]))
+            confident = ks32[0] >= args.min_part_score
+            distances.extend(np.linalg.norm(kc32[0][confident] - kc8[0][confident], axis=1))
+        distances = np.array(distances)
+        print('%s: %d frames at %s  fp32 %7.1f ms/frame  int8 %7.1f ms/frame  (%.1fx)' % (
+            path, len(inputs), 'x'.join(str(x) for x in inputs[0].shape[2:]),
+            1000. * times['fp32'] / len(inputs), 1000. * times['int8'] / len(inputs), times['fp32'] / times['int8']))
+        if len(distances):
+            print('    top pose found by int8 in %d/%d frames, pose score drift %.4f, keypoint drift %.2f px mean, '
+                  '%.2f px p95, %.1f%% within %g px' % (
+                      found, len(score_drift), np.mean(score_drift), distances.mean(),
+                      np.percentile(distances, 95), 100. * np.mean(distances <= args.pck), args.pck))
+        else:
+            print('    fp32 found no confident keypoints to compare')
+
+
+def _decode_multiple_poses_scalar(
+        scores, offsets, displacements_fwd, displacements_bwd, output_stride,
+        max_pose_detections=10, score_threshold=0.5, nms_radius=20, min_pose_score=0.5):
+    # the original one-root-at-a-time decoder, kept as the reference for equivalence checks
+    import numpy as np
+    from posenet.decode import decode_pose
+    from posenet.decode_multi import (
+        build_part_with_score_torch, within_nms_radius_fast, get_instance_score_fast)
+    from posenet.constants import LOCAL_MAXIMUM_RADIUS, NUM_KEYPOINTS
+
+    part_scores, part_idx = build_part_with_score_torch(score_threshold, LOCAL_MAXIMUM_RADIUS, scores)
+    part_scores = part_scores.cpu().numpy()
+    part_idx = part_idx.cpu().numpy()
+
+    scores = scores.cpu().numpy()
+    height = scores.shape[1]
+    width = scores.shape[2]
+    offsets = offsets.cpu().numpy().reshape(2, -1, height, width).transpose((1, 2, 3, 0))
+    displacements_fwd = displacements_fwd.cpu().numpy().reshape(2, -1, height, width).transpose((1, 2, 3, 0))
+    displacements_bwd = displacements_bwd.cpu().numpy().reshape(2, -1, height, width).transpose((1, 2, 3, 0))
+
+    squared_nms_radius = nms_radius ** 2
+    pose_count = 0
+    pose_scores = np.zeros(max_pose_detections)
+    pose_keypoint_scores = np.zeros((max_pose_detections, NUM_KEYPOINTS))
+    pose_keypoint_coords = np.zeros((max_pose_detections, NUM_KEYPOINTS, 2))
+
+    for root_score, (root_id, root_coord_y, root_coord_x) in zip(part_scores, part_idx):
+        root_coord = np.array([root_coord_y, root_coord_x])
+        root_image_coords = root_coord * output_stride + offsets[root_id, root_coord_y, root_coord_x]
+        if within_nms_radius_fast(
+                pose_keypoint_coords[:pose_count, root_id, :], squared_nms_radius, root_image_coords):
+            continue
+        keypoint_scores, keypoint_coords = decode_pose(
+            root_score, root_id, root_image_coords,
+            scores, offsets, output_stride,
+            displacements_fwd, displacements_bwd)
+        pose_score = get_instance_score_fast(
+            pose_keypoint_coords[:pose_count, :, :], squared_nms_radius, keypoint_scores, keypoint_coords)
+        if min_pose_score == 0. or pose_score >= min_pose_score:
+            pose_scores[pose_count] = pose_score
+            pose_keypoint_scores[pose_count, :] = keypoint_scores
+            pose_keypoint_coords[pose_count, :, :] = keypoint_coords
+            pose_count += 1
+        if pose_count >= max_pose_detections:
+            break
+
+    return pose_scores, pose_keypoint_scores, pose_keypoint_coords
+
+
+def bench_poses(args):
+    import numpy as np
+    import torch
+    import posenet
+
+    model = posenet.get_model(args.model)
+    frames = _read_frames(args.video, args.frames)
+    outputs = []
+    with torch.no_grad():
+        for f in frames:
+            input_image = posenet.utils._process_input(f, scale_factor=args.scale_factor)[0]
+            outputs.append([r.squeeze(0) for r in model(torch.Tensor(input_image))])
+
+    decoders = [
+        ('scalar', _decode_multiple_poses_scalar),
+        ('vectorized', posenet.decode_multiple_poses),
+    ]
+    results = {}
+    for name, decode in decoders:
+        start = time.time()
+        results[name] = [
+            decode(*out, output_stride=model.output_stride, max_pose_detections=10, min_pose_score=args.min_pose_score)
+            for out in outputs]
+        elapsed = time.time() - start
+        print('%-10s %8.2f ms/frame' % (name, 1000. * elapsed / len(outputs)))
+
+    for expected, actual in zip(results['scalar'], results['vectorized']):
+        for e, a in zip(expected, actual):
+            assert np.array_equal(e, a), 'vectorized decoder diverged from the scalar reference'
+    print('%d frames decoded identically' % len(outputs))
+
+
+def bench_sparse(args):
+    import numpy as np
+    import torch
+    import keyframes
+    import posenet
+    import scoring
+
+    model = posenet.get_model(args.model)
+
+    def infer(frames):
+        with torch.no_grad():
+            for f in frames:
+                input_image, _, output_scale = posenet.utils._process_input(f, scale_factor=args.scale_factor)
+                outputs = [r.squeeze(0) for r in model(torch.Tensor(input_image))]
+                pose_scores, keypoint_scores, keypoint_coords = posenet.decode_multiple_poses(
+                    *outputs, output_stride=model.output_stride, max_pose_detections=10, min_pose_score=0.25)
+                yield f, pose_scores, keypoint_scores, keypoint_coords * output_scale
+
+    settings = [(1, None)] + [(k, None) for k in args.strides] + [(k, args.motion) for k in args.strides]
+    print('%-10s %-16s %6s %8s %9s %10s %8s' % (
+        'video', 'mode', 'keys', 'speedup', 'px error', 'pck@10px', 'cosine'))
+    for path in args.videos:
+        frames = _read_frames(path, args.frames)
+        reference = None
+        for stride, motion in settings:
+            calls = [0]
+
+            def counted(keys):
+                for pose in infer(keys):
+                    calls[0] += 1
+                    yield pose
+
+            start = time.time()
+            poses = list(keyframes.sparse_poses(frames, counted, stride, motion))
+            elapsed = time.time() - start
+            coords = np.array([p[3][0] for p in poses])
+            confidence = np.array([p[2][0] for p in poses])
+            if reference is None:
+                reference = coords, confidence, elapsed
+            # error of the dancer's joints against full-rate inference, where that saw them
+            seen = reference[1] > 0.25
+            error = np.linalg.norm(coords - reference[0], axis=2)[seen]
+            mode = 'every frame' if stride == 1 else 'every %d%s' % (stride, ' +motion' if motion else '')
+            print('%-10s %-16s %6d %7.2fx %9.2f %9.1f%% %8.4f' % (
+                path, mode, calls[0], reference[2] / elapsed, error.mean(), 100. * np.mean(error < 10.),
+                np.nanmean(scoring.cosine_scores(coords, reference[0]))))
+
+
+def bench_track(args):
+    import numpy as np
+    import image_demp
+    import posenet
+    import scoring
+
+    print('%-10s %-7s %8s %10s %9s %10s %8s' % ('video', 'mode', 'ms/frame', 'crop area', 'px error', 'pck@10px', 'cosine'))
+    for path in args.videos:
+        frames = _read_frames(path, args.frames)
+        image_demp.warmup()
+        results = {}
+        for track in (False, True):
+            start = time.time()
+            results[track] = list(image_demp.estimate_poses(frames, batch_size=1, track=track))
+            elapsed = time.time() - start
+            coords = np.array([r[3][0] for r in results[track]])
+            reference = np.array([r[3][0] for r in results[False]])
+            seen = np.array([r[2][0] for r in results[False]]) > 0.25
+            error = np.linalg.norm(coords - reference, axis=2)[seen]
+            # the crop each frame was run on comes from the previous frame's dancer
+            areas = [1.]
+            for (frame, pose_scores, keypoint_scores, keypoint_coords) in results[track][:-1]:
+                box = posenet.person_box(keypoint_scores[0], keypoint_coords[0], frame.shape) \
+                    if track and pose_scores[0] > 0 else None
+                areas.append(1. if box is None else
+                             (box[2] - box[0]) * (box[3] - box[1]) / float(frame.shape[0] * frame.shape[1]))
+            print('%-10s %-7s %8.1f %9.0f%% %9.2f %9.1f%% %8.4f' % (
+                path, 'track' if track else 'full', 1000. * elapsed / len(frames), 100. * np.mean(areas),
+                error.mean(), 100. * np.mean(error < 10.), np.nanmean(scoring.cosine_scores(coords, reference))))
+
+
+def bench_resolution(args):
+    import torch
+    import image_demp
+    import posenet
+
+    model = posenet.get_model(image_demp.config.model)
+    fixed, per_pixel = image_demp.throughput_profile()
+    print('profile: %.1f ms + %.1f ms/Mpixel (%d threads)' % (fixed, 1e6 * per_pixel, torch.get_num_threads()))
+    for path in args.videos:
+        frames = _read_frames(path, args.frames)
+        for preset in ('fast', 'balanced', 'accurate'):
+            scale = image_demp.resolve_scale_factor(frames[0].shape, preset)
+            inputs = [posenet.utils._process_input(f, scale_factor=scale)[0] for f in frames]
+            with torch.no_grad():
+                model(torch.Tensor(inputs[0]))
+                start = time.time()
+                for input_image in inputs:
+                    model(torch.Tensor(input_image))
+                elapsed = 1000. * (time.time() - start) / len(inputs)
+            height, width = inputs[0].shape[2:]
+            print('%-10s %-9s budget %6s  scale %.2f  input %4dx%-4d  predicted %6.1f ms  measured %6.1f ms' % (
+                path, preset, '%g' % image_demp.PRESETS[preset] if image_demp.PRESETS[preset] else '-',
+                scale, width, height, fixed + per_pixel * width * height, elapsed))
+
+
+def _parse_output_reference(keypoints, keypoint_scores, pose_scores, num_poses, mirror, input_width):
+    # pose_engine.PoseEngine.ParseOutput before PoseArrays: a namedtuple per keypoint, eagerly
+    from pose_engine import Keypoint, KeypointType, Point, Pose
+
+    poses = []
+    for i in range(int(num_poses)):
+        pose_score = pose_scores[i]
+        pose_keypoints = {}
+        for j, point in enumerate(keypoints[i]):
+            y, x = point
+            if mirror:
+                y = input_width - y
+            pose_keypoints[KeypointType(j)] = Keypoint(Point(x, y), keypoint_scores[i, j])
+        poses.append(Pose(pose_keypoints, pose_score))
+    return poses
+
+
+def bench_parse(args):
+    import numpy as np
+    import pose_engine
+
+    # decoder outputs as the Edge TPU posenet_decoder lays them out (max 10 poses)
+    rng = np.random.RandomState(0)
+    outputs = [(
+        (rng.rand(10, 17, 2) * [args.height, args.width]).astype(np.float32),
+        rng.rand(10, 17).astype(np.float32),
+        np.sort(rng.rand(10).astype(np.float32))[::-1],
+        np.float32(args.poses)) for _ in range(args.frames)]
+
+    for out in outputs[:5]:
+        expected = _parse_output_reference(*out, mirror=args.mirror, input_width=args.width)
+        actual = pose_engine.Poses(pose_engine.parse_poses(*out, mirror=args.mirror, input_width=args.width))
+        assert len(actual) == len(expected)
+        for e, a in zip(expected, actual):
+            assert e.score == a.score and list(e.keypoints) == list(a.keypoints)
+            assert all(e.keypoints[k] == a.keypoints[k] for k in e.keypoints), 'Poses diverged from ParseOutput'
+
+    modes = [
+        ('namedtuples', lambda out: _parse_output_reference(*out, mirror=args.mirror, input_width=args.width)),
+        ('arrays', lambda out: pose_engine.parse_poses(*out, mirror=args.mirror, input_width=args.width)),
+        ('lazy, unread', lambda out: pose_engine.Poses(
+            pose_engine.parse_poses(*out, mirror=args.mirror, input_width=args.width))),
+        ('lazy, all read', lambda out: list(pose_engine.Poses(
+            pose_engine.parse_poses(*out, mirror=args.mirror, input_width=args.width)))),
+    ]
+    print('%d frames, %d poses each, mirror %s' % (len(outputs), args.poses, args.mirror))
+    for name, parse in modes:
+        start = time.time()
+        for out in outputs:
+            parse(out)
+        elapsed = time.time() - start
+        print('%-15s %8.1f us/frame' % (name, 1e6 * elapsed / len(outputs)))
+
+
+def bench_scoring(args):
+    import numpy as np
+    from numpy.linalg import norm
+    import scoring
+
+    rng = np.random.RandomState(0)
+    kp_a = rng.uniform(0, 720, (args.frames, 17, 2))
+    kp_b = kp_a + rng.normal(0, 20, kp_a.shape)
+    conf_a = rng.uniform(0, 1, (args.frames, 17))
+    conf_b = rng.uniform(0, 1, (args.frames, 17))
+
+    # the original per-frame loop from /upload-video (raw, uncentered vectors)
+    start = time.time()
+    flat_a = kp_a.reshape(args.frames, 34)
+    flat_b = kp_b.reshape(args.frames, 34)
+    loop_scores = []
+    for i in range(args.frames):
+        da = flat_a[i]
+        db = flat_b[i]
+        loop_scores += [np.inner(da, db/(norm(da)*norm(db)))]
+    print('%-34s %8.1f ms' % ('per-frame loop (cosine only)', 1000. * (time.time() - start)))
+
+    start = time.time()
+    result = scoring.score_poses(kp_a, kp_b, conf_a, conf_b)
+    print('%-34s %8.1f ms' % ('score_poses (cosine+weighted+joints)', 1000. * (time.time() - start)))
+    print('%d frames, mean cosine %.4f, mean weighted %.4f, mean joint error %.4f' % (
+        args.frames, np.nanmean(result['cosine']), np.nanmean(result['weighted']),
+        np.nanmean(result['joint_errors'])))
+
+
+def bench_dtw(args):
+    import numpy as np
+    import alignment
+
+    n = int(args.minutes * 60 * args.fps)
+    lag = int(args.lag * args.fps)
+    rng = np.random.RandomState(0)
+    # a smooth synthetic dance, and a student who runs `lag` seconds behind and drifts in tempo
+    t = np.arange(n + lag) / float(args.fps)
+    phases = rng.uniform(0, 2 * np.pi, (17, 2))
+    freqs = rng.uniform(0.2, 2., (17, 2))
+    track = 200 + 100 * np.sin(t[:, None, None] * freqs + phases)
+    warp = np.clip(np.arange(n) - lag + (lag * np.sin(np.linspace(0, np.pi, n))), 0, n + lag - 1)
+    kp_a = track[:n]
+    kp_b = track[np.round(warp).astype(int) + lag]
+
+    start = time.time()
+    path, scores = alignment.align_poses(kp_a, kp_b, window=int(args.window * args.fps))
+    elapsed = time.time() - start
+    print('%d x %d frames, band +-%d: %.2f s, path %d steps, mean aligned score %.4f (frame-by-frame %.4f)' % (
+        n, n, int(args.window * args.fps), elapsed, len(path), scores.mean(),
+        np.mean(np.sum(alignment.pose_descriptors(kp_a) * alignment.pose_descriptors(kp_b), axis=1))))
+
+
+def bench_offset(args):
+    import numpy as np
+    import alignment
+
+    n = int(args.seconds * args.fps)
+    max_lag = int(args.max_offset * args.fps)
+    rng = np.random.RandomState(0)
+    t = np.arange(n + 2 * max_lag) / float(args.fps)
+    phases = rng.uniform(0, 2 * np.pi, (17, 2))
+    freqs = rng.uniform(0.2, 2., (17, 2))
+    track = 200 + 100 * np.sin(t[:, None, None] * freqs + phases)
+    onsets = rng.exponential(1., len(t)) * (rng.uniform(size=len(t)) < 0.1)
+    for lag in args.lags:
+        # video b starts `lag` frames earlier than video a, plus detection noise
+        a = slice(max_lag, max_lag + n)
+        b = slice(max_lag - lag, max_lag - lag + n)
+        kp_a = track[a] + rng.normal(0, 5, (n, 17, 2))
+        kp_b = track[b] + rng.normal(0, 5, (n, 17, 2))
+        signals = [(alignment.pose_descriptors(kp_a), alignment.pose_descriptors(kp_b)),
+                   (onsets[a], onsets[b])]
+        start = time.time()
+        found, confidence = alignment.estimate_offset(signals, max_lag)
+        elapsed = time.time() - start
+        print('lag %+d: found %+d (confidence %.3f) in %.1f ms' % (lag, found, confidence, elapsed * 1e3))
+        assert found == lag
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    p = subparsers.add_parser('startup', help='module import time in a fresh interpreter')
+    p.add_argument('--modules', nargs='+', default=['image_demp', 'posenet'])
+    p.add_argument('--repeat', type=int, default=3)
+    p.set_defaults(func=bench_startup)
+
+    p = subparsers.add_parser('decode', help='paired video decoding throughput')
+    p.add_argument('--videos', nargs='+', default=['test.mp4', 'left.mp4', 'right.mp4'])
+    p.set_defaults(func=bench_decode)
+
+    p = subparsers.add_parser('resample', help='frames decoded and passed on at lower analysis rates')
+    p.add_argument('--videos', nargs='+', default=['left.mp4', 'test.mp4'])
+    p.add_argument('--fps', type=float, nargs='+', default=[24., 15.])
+    p.set_defaults(func=bench_resample)
+
+    p = subparsers.add_parser('convert', help='tfjs weight decoding: struct.unpack vs np.frombuffer')
+    p.add_argument('--base_dir', default=os.path.join(tempfile.gettempdir(), '_posenet_weights'))
+    p.add_argument('--models', type=int, nargs='+', default=[50, 75, 100, 101])
+    p.add_argument('--workers', type=int, default=8)
+    p.set_defaults(func=bench_convert)
+
+    p = subparsers.add_parser('preprocess', help='frame preprocessing time and transient allocations')
+    p.add_argument('--video', default='test.mp4')
+    p.add_argument('--frames', type=int, default=30)
+    p.add_argument('--scale_factor', type=float, default=1.0)
+    p.set_defaults(func=bench_preprocess)
+
+    p = subparsers.add_parser('batch', help='PoseNet forward throughput vs batch size')
+    p.add_argument('--video', default='left.mp4')
+    p.add_argument('--frames', type=int, default=64)
+    p.add_argument('--model', type=int, default=101)
+    p.add_argument('--scale_factor', type=float, default=1.0)
+    p.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    p.set_defaults(func=bench_batch)
+
+    p = subparsers.add_parser('backends', help='PoseNet output equivalence and speed per inference backend')
+    p.add_argument('--video', default='test.mp4')
+    p.add_argument('--frames', type=int, default=16)
+    p.add_argument('--model', type=int, default=101)
+    p.add_argument('--scale_factor', type=float, default=1.0)
+    p.add_argument('--batch_size', type=int, default=1)
+    p.add_argument('--backends', nargs='+', default=['eager', 'torchscript', 'onnxruntime', 'opencv'],
+                   help='the first one is the reference')
+    p.add_argument('--tolerance', type=float, default=1e-4)
+    p.set_defaults(func=bench_backends)
+
+    p = subparsers.add_parser('quantize', help='int8 PoseNet keypoint drift and speed against fp32')
+    p.add_argument('--videos', nargs='+', default=['test.mp4', 'left.mp4', 'right.mp4'])
+    p.add_argument('--frames', type=int, default=30)
+    p.add_argument('--model', type=int, default=101)
+    p.add_argument('--scale_factor', type=float, default=1.0)
+    p.add_argument('--min_part_score', type=float, default=0.25)
+    p.add_argument('--pck', type=float, default=5., help='keypoint distance counted as unchanged, pixels')
+    p.set_defaults(func=bench_quantize)
+
+    p = subparsers.add_parser('poses', help='multi-pose decoder equivalence and ms/frame')
+    p.add_argument('--video', default='test.mp4')
+    p.add_argument('--frames', type=int, default=16)
+    p.add_argument('--model', type=int, default=101)
+    p.add_argument('--scale_factor', type=float, default=1.0)
+    p.add_argument('--min_pose_score', type=float, default=0.25)
+    p.set_defaults(func=bench_poses)
+
+    p = subparsers.add_parser('sparse', help='keyframe inference accuracy vs speed against every-frame inference')
+    p.add_argument('--videos', nargs='+', default=['left.mp4', 'right.mp4', 'test.mp4'])
+    p.add_argument('--frames', type=int, default=150)
+    p.add_argument('--model', type=int, default=101)
+    p.add_argument('--scale_factor', type=float, default=1.0)
+    p.add_argument('--strides', type=int, nargs='+', default=[2, 3, 5])
+    p.add_argument('--motion', type=float, default=0.06, help='motion threshold for adaptive keyframes')
+    p.set_defaults(func=bench_sparse)
+
+    p = subparsers.add_parser('track', help='person-crop tracking vs full-frame inference')
+    p.add_argument('--videos', nargs='+', default=['test.mp4', 'left.mp4'])
+    p.add_argument('--frames', type=int, default=60)
+    p.set_defaults(func=bench_track)
+
+    p = subparsers.add_parser('resolution', help='input scale chosen by each preset and the latency it gets')
+    p.add_argument('--videos', nargs='+', default=['test.mp4', 'left.mp4'])
+    p.add_argument('--frames', type=int, default=10)
+    p.set_defaults(func=bench_resolution)
+
+    p = subparsers.add_parser('parse', help='Edge TPU PoseEngine output parsing: namedtuples vs arrays')
+    p.add_argument('--frames', type=int, default=2000)
+    p.add_argument('--poses', type=int, default=10)
+    p.add_argument('--width', type=int, default=641)
+    p.add_argument('--height', type=int, default=481)
+    p.add_argument('--mirror', action='store_true')
+    p.set_defaults(func=bench_parse)
+
+    p = subparsers.add_parser('scoring', help='vectorized pose scoring on synthetic tracks')
+    p.add_argument('--frames', type=int, default=100000)
+    p.set_defaults(func=bench_scoring)
+
+    p = subparsers.add_parser('dtw', help='banded DTW alignment on a synthetic tempo-varying pair')
+    p.add_argument('--minutes', type=float, default=10.)
+    p.add_argument('--fps', type=float, default=30.)
+    p.add_argument('--window', type=float, default=3., help='Sakoe-Chiba band, seconds')
+    p.add_argument('--lag', type=float, default=0.5, help='student delay, seconds')
+    p.set_defaults(func=bench_dtw)
+
+    p = subparsers.add_parser('offset', help='FFT start-offset estimation on synthetic shifted pairs')
+    p.add_argument('--seconds', type=float, default=60.)
+    p.add_argument('--fps', type=float, default=30.)
+    p.add_argument('--max_offset', type=float, default=10., help='seconds')
+    p.add_argument('--lags', type=int, nargs='+', default=[0, 7, -13, 45, -90, 299])
+    p.set_defaults(func=bench_offset)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+# Picked up automatically by `gunicorn app:server` (see Procfile).
+import threading
+
+
+def post_worker_init(worker):
+    # load the PoseNet checkpoint in the background: the worker serves pages and status polls
+    # straight away, and a comparison arriving first waits on the same load instead of repeating it
+    import image_demp
+    threading.Thread(target=image_demp.warmup, name='posenet-warmup', daemon=True).start()
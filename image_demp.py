@@ -1,101 +1,399 @@
-import cv2
+import contextlib
 import time
-import argparse
+import itertools
 import os
-import torch
+import threading
+import numpy as np
 
-import posenet
+import keyframes
 
+# torch, cv2 and posenet take seconds to import: they are only imported inside the functions
+# that run the model, so importing this module (e.g. in a web worker) stays cheap
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--model', type=int, default=101)
-parser.add_argument('--scale_factor', type=float, default=1.0)
-parser.add_argument('--notxt', action='store_true')
-parser.add_argument('--image_dir', type=str, default='./images')
-parser.add_argument('--output_dir', type=str, default='./output')
-args = parser.parse_args()
 
+class Config(object):
+    """Defaults for every pass in this process; the CLI fills them from its flags."""
 
-def main(dd, statte):
-    model = posenet.load_model(args.model)
+    def __init__(self, model=101, scale_factor=1.0, batch_size=1, track=False, backend='eager'):
+        self.model = model
+        self.scale_factor = scale_factor
+        self.batch_size = batch_size
+        self.track = track
+        self.backend = backend
+
+
+config = Config()
+
+# Per-frame latency budgets (ms, one inference pass) for the resolution presets; "accurate"
+# always runs at the source resolution
+PRESETS = {'fast': 60., 'balanced': 150., 'accurate': None}
+# Never shrink a frame's short side below this: smaller people stop being found at all
+MIN_INPUT_SIDE = 193
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+# passes currently sharing torch's threads (see parallel_streams)
+_streams = {'active': 0, 'saved_threads': None}
+_streams_lock = threading.Lock()
+
+
+def _batches(dd, batch_size, scale_factor):
+    """Preprocesses frames and groups them into batches of at most `batch_size` frames of the
+    same resolution. Yields `(input_images, batch)`: the (n, 3, H, W) model input and the
+    `(draw_image, output_scale)` of each frame.
+
+    The inputs are views of reused buffers, so each batch must be through the model before the
+    next one is requested."""
+    import posenet
+
+    preprocessor = posenet.Preprocessor(batch_size)
+    size = None
+    batch = []
+    for d in dd:
+        width, height = posenet.valid_resolution(d.shape[1] * scale_factor, d.shape[0] * scale_factor)
+        if batch and (height, width) != size:
+            # the new resolution has buffers of its own: the pending batch is still intact
+            yield preprocessor.buffers(*size)[1][:len(batch)], batch
+            batch = []
+        size = (height, width)
+        _, draw_image, output_scale = preprocessor.process(d, scale_factor, slot=len(batch))
+        batch.append((draw_image, output_scale))
+        if len(batch) == batch_size:
+            yield preprocessor.buffers(*size)[1], batch
+            batch = []
+    if batch:
+        yield preprocessor.buffers(*size)[1][:len(batch)], batch
+
+
+def _decode(model, input_images):
+    """Runs a (n, 3, H, W) float32 batch of preprocessed inputs through the model and returns the
+    `(pose_scores, keypoint_scores, keypoint_coords)` of each, in input-pixel coordinates."""
+    import torch
+    import posenet
+
+    with torch.no_grad():
+        # shares the preprocessing buffer instead of copying it
+        input_image = torch.from_numpy(input_images)#.cuda()
+
+        heatmaps_result, offsets_result, displacement_fwd_result, displacement_bwd_result = model(input_image)
+
+    decoded = []
+    for bi in range(len(input_images)):
+        decoded.append(posenet.decode_multiple_poses(
+            heatmaps_result[bi],
+            offsets_result[bi],
+            displacement_fwd_result[bi],
+            displacement_bwd_result[bi],
+            output_stride=model.output_stride,
+            max_pose_detections=10,
+            min_pose_score=0.25))
+    return decoded
+
+
+def _tracked(dd, decode, scale_factor):
+    """Yields `(frame, pose_scores, keypoint_scores, keypoint_coords)` per frame, running the model
+    on a padded crop around where the dancer was in the previous frame instead of the whole frame.
+
+    The first frame, and any frame where the crop comes back without a pose, is run at full
+    size, and the dancer's box is searched for again from there."""
+    import posenet
+
+    preprocessor = posenet.Preprocessor()
+    box = None
+    for frame in dd:
+        decoded = None
+        y0, x0, y1, x1 = box if box is not None else (0, 0, 0, 0)
+        crop = frame[y0:y1, x0:x1]
+        if crop.size:
+            input_image, _, output_scale = preprocessor.process(crop, scale_factor)
+            pose_scores, keypoint_scores, keypoint_coords = decode(input_image)[0]
+            if pose_scores[0] > 0:
+                keypoint_coords *= output_scale
+                # back to full-frame pixels; empty pose slots stay all-zero
+                keypoint_coords[pose_scores > 0] += (y0, x0)
+                decoded = pose_scores, keypoint_scores, keypoint_coords
+        if decoded is None:
+            # first frame, or the dancer left the crop: fall back to the full frame
+            input_image, _, output_scale = preprocessor.process(frame, scale_factor)
+            pose_scores, keypoint_scores, keypoint_coords = decode(input_image)[0]
+            keypoint_coords *= output_scale
+            decoded = pose_scores, keypoint_scores, keypoint_coords
+        box = None
+        if pose_scores[0] > 0:
+            box = posenet.person_box(keypoint_scores[0], keypoint_coords[0], frame.shape)
+        yield (frame,) + decoded
+
+
+def estimate_poses(dd, batch_size=None, track=None, scale_factor=None):
+    """Runs PoseNet over the frames of `dd` and yields
+    `(frame, pose_scores, keypoint_scores, keypoint_coords)` per frame, with coordinates in
+    frame pixels. Frames are pushed through the network `batch_size` at a time
+    (default `config.batch_size`). With `track` (default `config.track`) each frame is cropped to the
+    dancer's surroundings in the previous one first (see `_tracked`); frames then depend on
+    each other, so they go through one at a time. Frames are resized by `scale_factor`
+    (default `config.scale_factor`) before inference."""
+    import posenet
+
+    load_start = time.time()
+    model = posenet.get_model(config.model, backend=config.backend)
+    load_time = time.time() - load_start
     # model = model.cuda()
-    output_stride = model.output_stride
+    if batch_size is None:
+        batch_size = config.batch_size
+    if track is None:
+        track = config.track
+    if scale_factor is None:
+        scale_factor = config.scale_factor
 
-    result = []
-    result_s = []
+    inference_time = [0.]
 
-    # if args.output_dir:
-    #     if not os.path.exists(args.output_dir):
-    #         os.makedirs(args.output_dir)
+    def decode(input_images):
+        inference_start = time.time()
+        decoded = _decode(model, input_images)
+        inference_time[0] += time.time() - inference_start
+        return decoded
 
-    # filenames = [
-    #     f.path for f in os.scandir(args.image_dir) if f.is_file() and f.path.endswith(('.png', '.jpg'))]
+    def batched():
+        for input_images, batch in _batches(dd, batch_size, scale_factor):
+            decoded = decode(input_images)
+            for (draw_image, output_scale), (pose_scores, keypoint_scores, keypoint_coords) in zip(batch, decoded):
+                keypoint_coords *= output_scale
+                yield draw_image, pose_scores, keypoint_scores, keypoint_coords
 
     start = time.time()
-    # for f in filenames:
-    for iid,d in enumerate(dd):
-        print(iid,end=' ... ')
-        statte[0] = str(iid)+" / "+str(len(dd))
-        input_image, draw_image, output_scale = posenet.utils._process_input(d)
-        # input_image, draw_image, output_scale = posenet.read_imgfile(
-            # f, scale_factor=args.scale_factor, output_stride=output_stride)
-        # print(input_image)
-        # print(draw_image)
-        # print(output_scale)
-
-        with torch.no_grad():
-            input_image = torch.Tensor(input_image)#.cuda()
-
-            heatmaps_result, offsets_result, displacement_fwd_result, displacement_bwd_result = model(input_image)
-
-            pose_scores, keypoint_scores, keypoint_coords = posenet.decode_multiple_poses(
-                heatmaps_result.squeeze(0),
-                offsets_result.squeeze(0),
-                displacement_fwd_result.squeeze(0),
-                displacement_bwd_result.squeeze(0),
-                output_stride=output_stride,
-                max_pose_detections=10,
-                min_pose_score=0.25)
-
-        keypoint_coords *= output_scale
-
-        # if args.output_dir:
+    count = 0
+    for pose in (_tracked(dd, decode, scale_factor) if track else batched()):
+        count += 1
+        yield pose
+
+    if count:
+        # print('Average FPS:', len(filenames) / (time.time() - start))
+        print('Average FPS:', count / (time.time() - start))
+        print('Model load: %.3fs, inference: %.3fs (%.1f FPS)' % (
+            load_time, inference_time[0], count / inference_time[0] if inference_time[0] else 0.))
+
+
+def throughput_profile(model_id=None, sides=(257, 385, 513)):
+    """Measured cost of one forward pass as `(fixed_ms, ms_per_pixel)`.
+
+    Square dummy inputs of each size in `sides` are timed and a line is fitted through
+    (pixels, ms): MobileNetV1 is fully convolutional, so its cost grows linearly with the input
+    area. Profiles are cached per model, backend and torch thread count; concurrent callers
+    wait for the first measurement instead of skewing it."""
+    import torch
+    import posenet
+
+    if model_id is None:
+        model_id = config.model
+    key = (model_id, config.backend, torch.get_num_threads())
+    with _profiles_lock:
+        if key not in _profiles:
+            model = posenet.get_model(model_id, backend=config.backend)
+            pixels, times = [], []
+            with torch.no_grad():
+                for side in sides:
+                    dummy = torch.zeros(1, 3, side, side)
+                    model(dummy)
+                    best = float('inf')
+                    for _ in range(3):
+                        start = time.time()
+                        model(dummy)
+                        best = min(best, time.time() - start)
+                    pixels.append(side * side)
+                    times.append(1000. * best)
+            per_pixel, fixed = np.polyfit(pixels, times, 1)
+            _profiles[key] = (max(fixed, 0.), max(per_pixel, 1e-9))
+            print('PoseNet %d profile (%s, %d threads): %.1f ms + %.1f ms/Mpixel' % (
+                model_id, key[1], key[2], _profiles[key][0], 1e6 * _profiles[key][1]))
+        return _profiles[key]
+
+
+def scale_for_budget(frame_shape, budget_ms, profile):
+    """Largest `scale_factor` (at most 1, in steps of 0.05) whose input fits `budget_ms` per frame
+    under `profile`, but never below MIN_INPUT_SIDE on the short side."""
+    fixed, per_pixel = profile
+    height, width = frame_shape[:2]
+    scale = np.sqrt(max(budget_ms - fixed, 0.) / per_pixel / (height * width))
+    # quantized so the same video gets the same scale (and pose cache key) from run to run
+    scale = np.floor(scale * 20.) / 20.
+    return float(min(1., max(scale, MIN_INPUT_SIDE / float(min(height, width)))))
+
+
+def resolve_scale_factor(frame_shape, preset=None):
+    """The `scale_factor` to run a video with frames of `frame_shape` at: `config.scale_factor`
+    without a preset, else whatever fits the preset's latency budget on this machine."""
+    if preset is None:
+        return config.scale_factor
+    if preset not in PRESETS:
+        raise ValueError('unknown preset %r, expected one of %s' % (preset, ', '.join(sorted(PRESETS))))
+    if PRESETS[preset] is None:
+        return 1.
+    return scale_for_budget(frame_shape, PRESETS[preset], throughput_profile())
+
+
+def main(dd, statte, total=None, batch_size=None, slot=0, pose_cache=None, video_digest=None,
+         stride=1, motion_threshold=None, track=None, preset=None):
+    """Runs PoseNet over the frames of `dd` (any iterable) and yields
+    `(draw_image, keypoint_coords, keypoint_scores)` per frame as soon as it is ready, where the
+    (17, 2) coords and (17,) scores belong to the dancer's pose.
+
+    Progress is written to `statte[slot]`, so concurrent passes can report side by side.
+    With a `pose_cache` and the `video_digest` of the source file, frames already in the cache
+    skip inference entirely (only the overlay is drawn), and the full track is stored afterwards.
+    With `stride` > 1 or a `motion_threshold`, PoseNet only runs on keyframes and the poses in
+    between are interpolated (see `keyframes.sparse_poses`). `track` crops each inference to
+    the dancer's surroundings (see `estimate_poses`). `preset` ("fast", "balanced" or
+    "accurate") picks the input resolution from the first frame's size and this machine's
+    measured throughput; without one `config.scale_factor` is used."""
+    import posenet
+
+    if total is None and hasattr(dd, '__len__'):
+        total = len(dd)
+    if track is None:
+        track = config.track
+
+    frames = iter(dd)
+    first = next(frames, None)
+    if first is None:
+        return
+    frames = itertools.chain([first], frames)
+    scale_factor = resolve_scale_factor(first.shape, preset)
+    print('input scale %.2f for %dx%d frames' % (scale_factor, first.shape[1], first.shape[0]))
+
+    cache_key = None
+    cached = None
+    if pose_cache is not None and video_digest is not None:
+        cache_key = pose_cache.key(video_digest, config.model, scale_factor, config.backend)
+        if stride > 1 or motion_threshold is not None:
+            # interpolated tracks must never be served to a full-rate request
+            cache_key += '-k%d-m%g' % (stride, motion_threshold or 0)
+        if track:
+            cache_key += '-track'
+        cached = pose_cache.get(cache_key)
+    cached_count = len(cached[0]) if cached is not None else 0
+    if cached is not None:
+        print('pose cache hit: %d frames' % cached_count)
+
+    def poses():
+        # zip checks range() first, so no frame past the cached ones is consumed here; a track
+        # cached from a shorter (truncated) pass is extended with live inference
+        for i, frame in zip(range(cached_count), frames):
+            yield frame, cached[0][i], cached[1][i], cached[2][i]
+        for pose in keyframes.sparse_poses(
+                frames, lambda keys: estimate_poses(keys, batch_size, track, scale_factor), stride, motion_threshold):
+            yield pose
+
+    history = ([], [], [])
+    count = 0
+    for draw_image, pose_scores, keypoint_scores, keypoint_coords in poses():
+        print(count,end=' ... ')
+        statte[slot] = str(count)+" / "+str(total if total is not None else "?")
+
+        if cache_key is not None:
+            # kept until the end of the video, in the float32 the cache stores anyway
+            history[0].append(np.asarray(pose_scores, dtype=np.float32))
+            history[1].append(np.asarray(keypoint_scores, dtype=np.float32))
+            history[2].append(np.asarray(keypoint_coords, dtype=np.float32))
+
         draw_image = posenet.draw_skel_and_kp(
             draw_image, pose_scores, keypoint_scores, keypoint_coords,
             min_pose_score=0.25, min_part_score=0.25)
 
-        result += [draw_image]
-            # cv2.imwrite(os.path.join(args.output_dir, os.path.relpath(f, args.image_dir)), draw_image)
-        
+        # the first decoded pose is the dancer; all zeros when nobody was found
+        count += 1
+        yield draw_image, keypoint_coords[0], keypoint_scores[0]
+
+    if cache_key is not None and count > cached_count:
+        pose_cache.put(cache_key, *history)
+
+
+@contextlib.contextmanager
+def parallel_streams(n):
+    """Splits torch's intra-op thread budget between `n` passes running concurrently, for as
+    long as the block runs.
+
+    Each thread calling into torch gets its own pool of `torch.get_num_threads()` workers, so
+    without this two concurrent passes would oversubscribe the CPU twice over. What is split is
+    the thread count in effect before the first block (e.g. from OMP_NUM_THREADS or an earlier
+    torch.set_num_threads), never more. The count is process-wide: blocks entered by
+    other jobs (JOB_WORKERS > 1) add their streams to the split, and the saved count is restored
+    when the last one exits."""
+    import torch
+
+    with _streams_lock:
+        if not _streams['active']:
+            _streams['saved_threads'] = torch.get_num_threads()
+        _streams['active'] += n
+        torch.set_num_threads(max(1, _streams['saved_threads'] // _streams['active']))
+    try:
+        yield
+    finally:
+        with _streams_lock:
+            _streams['active'] -= n
+            if _streams['active']:
+                torch.set_num_threads(max(1, _streams['saved_threads'] // _streams['active']))
+            else:
+                torch.set_num_threads(_streams['saved_threads'])
+
+
+def warmup():
+    """Loads the shared model and runs one dummy frame through it, so the first request
+    doesn't pay for checkpoint loading or lazy torch initialisation."""
+    import torch
+    import posenet
+
+    model = posenet.get_model(config.model, backend=config.backend)
+    with torch.no_grad():
+        model(torch.zeros(1, 3, 257, 257))
+    print('PoseNet %d (%s) warm, loaded in %.3fs' % (config.model, config.backend, posenet.model_load_times()[
+        (config.model, model.output_stride, config.backend)]))
 
-        result_temp = []
-        for pi in range(len(pose_scores)):
-            if pose_scores[pi] == 0.:
-                break
-            for ki, (s, c) in enumerate(zip(keypoint_scores[pi, :], keypoint_coords[pi, :, :])):
-                result_temp += list(c)
 
-        # print(result_temp)
-        if result_temp == []:
-            result_temp = [0]*68
+def cli(argv=None):
+    """Command line entry point: draws the poses found in every .png/.jpg of `--image_dir` into
+    `--output_dir`, and prints them unless `--notxt`."""
+    import argparse
+    import cv2
+    import posenet
 
-        result_s += [result_temp]
-        # if not args.notxt:
-        #     print()
-        #     print("Results for image: %s" % f)
-        #     for pi in range(len(pose_scores)):
-        #         if pose_scores[pi] == 0.:
-        #             break
-        #         print('Pose #%d, score = %f' % (pi, pose_scores[pi]))
-        #         for ki, (s, c) in enumerate(zip(keypoint_scores[pi, :], keypoint_coords[pi, :, :])):
-        #             print('Keypoint %s, score = %f, coord = %s' % (posenet.PART_NAMES[ki], s, c))
+    global config
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=int, default=101)
+    parser.add_argument('--scale_factor', type=float, default=1.0)
+    parser.add_argument('--batch_size', type=int, default=1)
+    parser.add_argument('--track', action='store_true')
+    parser.add_argument('--backend', choices=posenet.BACKENDS, default='eager')
+    parser.add_argument('--notxt', action='store_true')
+    parser.add_argument('--image_dir', type=str, default='./images')
+    parser.add_argument('--output_dir', type=str, default='./output')
+    args = parser.parse_args(argv)
+    config = Config(model=args.model, scale_factor=args.scale_factor, batch_size=args.batch_size, track=args.track,
+                    backend=args.backend)
 
-    # print('Average FPS:', len(filenames) / (time.time() - start))
-    print('Average FPS:', len(dd) / (time.time() - start))
+    if args.output_dir and not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+    filenames = [
+        f.path for f in os.scandir(args.image_dir) if f.is_file() and f.path.endswith(('.png', '.jpg'))]
 
-    return result, result_s
+    images = (cv2.imread(f) for f in filenames)
+    for f, (image, pose_scores, keypoint_scores, keypoint_coords) in zip(filenames, estimate_poses(images)):
+        if args.output_dir:
+            draw_image = posenet.draw_skel_and_kp(
+                image, pose_scores, keypoint_scores, keypoint_coords,
+                min_pose_score=0.25, min_part_score=0.25)
+            cv2.imwrite(os.path.join(args.output_dir, os.path.relpath(f, args.image_dir)), draw_image)
 
+        if not args.notxt:
+            print()
+            print("Results for image: %s" % f)
+            for pi in range(len(pose_scores)):
+                if pose_scores[pi] == 0.:
+                    break
+                print('Pose #%d, score = %f' % (pi, pose_scores[pi]))
+                for ki, (s, c) in enumerate(zip(keypoint_scores[pi, :], keypoint_coords[pi, :, :])):
+                    print('Keypoint %s, score = %f, coord = %s' % (posenet.PART_NAMES[ki], s, c))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    cli()
\ No newline at end of file
@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class _Progress(list):
+    """The per-job replacement for the old global `statte` list: same indexing, but every
+    write is reported back to the owning job."""
+
+    def __init__(self, job, slots):
+        super(_Progress, self).__init__([""] * slots)
+        self._job = job
+
+    def __setitem__(self, index, value):
+        super(_Progress, self).__setitem__(index, value)
+        self._job._changed()
+
+
+class Job(object):
+    def __init__(self, job_id, queue, progress_slots=2):
+        self.id = job_id
+        self.status = QUEUED
+        self.progress = _Progress(self, progress_slots)
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.updated = self.created
+        self._queue = queue
+        self._saved = 0.
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'progress': list(self.progress),
+            'result': self.result,
+            'error': self.error,
+            'created': self.created,
+            'updated': self.updated,
+        }
+
+    def _changed(self, force=False):
+        self.updated = time.time()
+        # progress ticks every frame; don't hit the disk more than a few times a second
+        if force or self.updated - self._saved >= self._queue.save_interval:
+            self._saved = self.updated
+            self._queue._save(self)
+
+
+class JobQueue(object):
+    """In-process job queue: a thread pool runs submitted jobs and tracks their progress.
+
+    With `state_dir` set, every job's state is also written to `<state_dir>/<id>.json`, so any
+    process sharing the directory (e.g. another gunicorn worker) can answer status polls.
+    No external broker is needed. With `ttl` set, `cleanup` forgets jobs finished more than
+    `ttl` seconds ago, along with their state files.
+    """
+
+    def __init__(self, workers=1, state_dir=None, save_interval=0.5, ttl=None):
+        self.state_dir = state_dir
+        self.save_interval = save_interval
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        if state_dir and not os.path.exists(state_dir):
+            os.makedirs(state_dir)
+
+    def submit(self, fn, *args, **kwargs):
+        """Queues `fn(job, *args, **kwargs)` and returns the new Job immediately.
+        Whatever `fn` returns (JSON-serializable) becomes `job.result`."""
+        job = Job(uuid.uuid4().hex, self)
+        with self._lock:
+            self._jobs[job.id] = job
+        job._changed(force=True)
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        """Returns the job's state as a dict, or None if no such job is known."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        path = self._path(job_id)
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def cleanup(self):
+        """Drops finished jobs last updated more than `ttl` seconds ago, and state files (of
+        this or any other process sharing `state_dir`) not written to for as long."""
+        if self.ttl is None:
+            return
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.status in (DONE, FAILED) and job.updated < cutoff:
+                    del self._jobs[job_id]
+            active = set(self._jobs)
+        if not self.state_dir:
+            return
+        for name in os.listdir(self.state_dir):
+            job_id, ext = os.path.splitext(name)
+            path = os.path.join(self.state_dir, name)
+            if ext != '.json' or job_id in active:
+                continue
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass  # removed by another process in the meantime
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = RUNNING
+        job._changed(force=True)
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = DONE
+        except Exception as e:
+            traceback.print_exc()
+            job.error = '%s: %s' % (type(e).__name__, e)
+            job.status = FAILED
+        job._changed(force=True)
+
+    def _path(self, job_id):
+        if not self.state_dir or not job_id or not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        return os.path.join(self.state_dir, job_id + '.json')
+
+    def _save(self, job):
+        path = self._path(job.id)
+        if path is None:
+            return
+        tmp = '%s.%d.tmp' % (path, threading.get_ident())
+        with open(tmp, 'w') as f:
+            json.dump(job.to_dict(), f)
+        os.replace(tmp, path)
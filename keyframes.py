@@ -0,0 +1,84 @@
+import collections
+
+import numpy as np
+
+
+def thumbnail(frame, step=8):
+    # every `step`-th pixel, grey: enough to notice a dancer moving, and ~100x cheaper than PoseNet
+    return frame[::step, ::step].astype(np.float32).mean(axis=2)
+
+
+def motion(thumb_a, thumb_b):
+    """Mean absolute difference of two `thumbnail`s, in [0, 1]."""
+    return float(np.abs(thumb_a - thumb_b).mean()) / 255.
+
+
+def interpolate(pose_a, pose_b, t):
+    """Blends two multi-pose results `(pose_scores, keypoint_scores, keypoint_coords)` at
+    `t` in [0, 1].
+
+    Poses are matched by slot (the decoder orders them by score, so slot 0 is the dancer in
+    both). A slot found in only one of the two keyframes is copied from the nearer one rather
+    than blended with an empty pose."""
+    both = (pose_a[0] > 0) & (pose_b[0] > 0)
+    nearer = pose_a if t < 0.5 else pose_b
+    blended = []
+    for a, b, near in zip(pose_a, pose_b, nearer):
+        mask = both.reshape(both.shape + (1,) * (a.ndim - 1))
+        blended.append(np.where(mask, (1. - t) * a + t * b, near))
+    return tuple(blended)
+
+
+def sparse_poses(frames, infer, stride=1, motion_threshold=None):
+    """Runs `infer` on keyframes only and fills in the frames between them by interpolation.
+
+    `infer` takes an iterable of frames and yields `(frame, pose_scores, keypoint_scores,
+    keypoint_coords)` for each, in order (e.g. `image_demp.estimate_poses`). Every `stride`-th
+    frame is a keyframe, and so is any frame whose `motion` since the last keyframe exceeds
+    `motion_threshold`, as is the last frame. Yields the same tuples as `infer` for every frame.
+
+    Frames between two keyframes are held back until the second keyframe's poses are in, so at
+    most about `stride` frames are buffered.
+    """
+    if stride <= 1 and motion_threshold is None:
+        for pose in infer(frames):
+            yield pose
+        return
+
+    # frames in input order waiting for their keyframe's result: (index, frame, is_keyframe)
+    pending = collections.deque()
+
+    def feed():
+        last_key = None
+        key_thumb = None
+        frames_iter = iter(frames)
+        frame = next(frames_iter, None)
+        index = 0
+        while frame is not None:
+            following = next(frames_iter, None)
+            thumb = thumbnail(frame) if motion_threshold is not None else None
+            is_key = (
+                last_key is None or following is None or index - last_key >= stride or
+                (thumb is not None and motion(thumb, key_thumb) > motion_threshold))
+            pending.append((index, frame, is_key))
+            if is_key:
+                last_key = index
+                key_thumb = thumb
+                yield frame
+            frame = following
+            index += 1
+
+    previous = None  # (index, pose) of the last keyframe
+    for frame, *pose in infer(feed()):
+        pose = tuple(pose)
+        between = []
+        while True:
+            index, held, is_key = pending.popleft()
+            if is_key:
+                break
+            between.append((index, held))
+        for i, held in between:
+            t = (i - previous[0]) / float(index - previous[0])
+            yield (held,) + interpolate(previous[1], pose, t)
+        yield (frame,) + pose
+        previous = (index, pose)
@@ -0,0 +1,150 @@
+import queue
+import threading
+
+
+_DONE = object()
+
+
+class _Failure(object):
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _close(iterable):
+    # propagate early shutdown to upstream generator stages
+    close = getattr(iterable, 'close', None)
+    if close is not None:
+        close()
+
+
+def buffered(iterable, maxsize=8):
+    """Runs `iterable` on a background thread and yields its items through a bounded queue.
+
+    The producer blocks once `maxsize` items are waiting, so memory stays constant no matter
+    how long the stream is. Exceptions raised by the producer are re-raised in the consumer.
+    """
+    q = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if not _put(q, item, stop):
+                    return
+            _put(q, _DONE, stop)
+        except BaseException as e:
+            _put(q, _Failure(e), stop)
+        finally:
+            _close(iterable)
+
+    worker = threading.Thread(target=produce, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.exc
+            yield item
+    finally:
+        # consumer stopped early (or failed): release the producer
+        stop.set()
+        worker.join()
+
+
+def split(iterable, n, maxsize=8):
+    """Fans an iterable of n-tuples out into n streams; stream k yields `item[k]`.
+
+    A single thread reads `iterable` and feeds one bounded queue per stream, so the streams can
+    be consumed concurrently from different threads. If any stream stops early, or is closed
+    before it was read to the end (even before its first item), all of them stop.
+    """
+    queues = [queue.Queue(maxsize=maxsize) for _ in range(n)]
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                for q, part in zip(queues, item):
+                    if not _put(q, part, stop):
+                        return
+            for q in queues:
+                _put(q, _DONE, stop)
+        except BaseException as e:
+            for q in queues:
+                _put(q, _Failure(e), stop)
+        finally:
+            _close(iterable)
+
+    worker = threading.Thread(target=produce, daemon=True)
+    start_lock = threading.Lock()
+
+    def start():
+        with start_lock:
+            if worker.ident is None:
+                worker.start()
+
+    return [_Stream(q, stop, start) for q in queues]
+
+
+class _Stream(object):
+    # one output of `split`. A generator closed before its first item never runs its cleanup,
+    # so stopping the split on close has to live outside it
+    def __init__(self, q, stop, start):
+        self._stop = stop
+        self._finished = False
+        self._items = self._read(q, start)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._items)
+
+    def close(self):
+        if not self._finished:
+            self._stop.set()
+        self._items.close()
+
+    def _read(self, q, start):
+        start()
+        try:
+            while True:
+                try:
+                    item = q.get(timeout=0.1)
+                except queue.Empty:
+                    if self._stop.is_set():
+                        return
+                    continue
+                if item is _DONE:
+                    self._finished = True
+                    return
+                if isinstance(item, _Failure):
+                    self._finished = True
+                    raise item.exc
+                yield item
+        finally:
+            if not self._finished:
+                self._stop.set()
+
+
+def chain(source, *stages, maxsize=8):
+    """Chains generator stages, each running on its own thread with a bounded queue in between.
+
+    Every stage is a callable taking an iterator and returning an iterator.
+    """
+    stream = buffered(source, maxsize)
+    for stage in stages:
+        stream = buffered(stage(stream), maxsize)
+    return stream
@@ -0,0 +1,83 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """sha256 of a file's contents, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class PoseCache(object):
+    """On-disk cache of per-frame PoseNet output, keyed by video content + model settings.
+
+    Each entry is one compressed .npz holding float32 `pose_scores` (T, P), `keypoint_scores`
+    (T, P, 17) and `keypoint_coords` (T, P, 17, 2). Entries are evicted least recently used
+    first once the cache grows past `max_bytes`.
+    """
+
+    def __init__(self, root='cache/poses', max_bytes=1 << 30):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if not os.path.exists(root):
+            os.makedirs(root)
+
+    @staticmethod
+    def key(video_digest, model_id, scale_factor, backend='eager'):
+        # the backend is part of the key: int8 gives different keypoints by design
+        return '%s-%d-%s-%g' % (video_digest, model_id, backend, scale_factor)
+
+    def get(self, key):
+        """Returns `(pose_scores, keypoint_scores, keypoint_coords)` for `key`, or None."""
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                entry = data['pose_scores'], data['keypoint_scores'], data['keypoint_coords']
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+        # a hit makes the entry most recently used
+        os.utime(path, None)
+        return entry
+
+    def put(self, key, pose_scores, keypoint_scores, keypoint_coords):
+        path = self._path(key)
+        tmp = '%s.%d.tmp' % (path, threading.get_ident())
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(
+                f,
+                pose_scores=np.asarray(pose_scores, dtype=np.float32),
+                keypoint_scores=np.asarray(keypoint_scores, dtype=np.float32),
+                keypoint_coords=np.asarray(keypoint_coords, dtype=np.float32))
+        os.replace(tmp, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.root):
+                if name.endswith('.npz'):
+                    path = os.path.join(self.root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+            entries.sort(reverse=True)
+            total = 0
+            for mtime, size, path in entries:
+                total += size
+                if total > self.max_bytes:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def _path(self, key):
+        return os.path.join(self.root, key + '.npz')
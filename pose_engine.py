@@ -12,12 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from pycoral.utils import edgetpu
 from PIL import Image
-from tflite_runtime.interpreter import load_delegate
-from tflite_runtime.interpreter import Interpreter
 
 import collections
+import collections.abc
 import enum
 import math
 import numpy as np
@@ -62,6 +60,50 @@ Keypoint = collections.namedtuple('Keypoint', ['point', 'score'])
 
 Pose = collections.namedtuple('Pose', ['keypoints', 'score'])
 
+# All poses of a frame as arrays: (N, 17, 2) keypoint (x, y), (N, 17) keypoint scores and
+# (N,) pose scores
+PoseArrays = collections.namedtuple('PoseArrays', ['keypoints', 'keypoint_scores', 'scores'])
+
+_KEYPOINT_TYPES = tuple(KeypointType)
+
+
+def parse_poses(keypoints, keypoint_scores, pose_scores, num_poses, mirror=False, input_width=None):
+    """`PoseArrays` from the PoseNet decoder's output tensors, with the first `num_poses` rows
+    copied out so they survive the next inference. With `mirror` the second coordinate is
+    flipped against `input_width`, as `ParseOutput` always has."""
+    n = int(num_poses)
+    # decoder keypoints are (y, x)
+    coords = keypoints[:n, :, ::-1].astype(np.float32)
+    if mirror:
+        coords[:, :, 1] = input_width - coords[:, :, 1]
+    return PoseArrays(
+        coords, np.array(keypoint_scores[:n], dtype=np.float32), np.array(pose_scores[:n], dtype=np.float32))
+
+
+class Poses(collections.abc.Sequence):
+    """Read-only list of `Pose` namedtuples over `PoseArrays`; each `Pose` and its keypoint dict
+    is only built when first indexed."""
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self._poses = [None] * len(arrays.scores)
+
+    def __len__(self):
+        return len(self._poses)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        pose = self._poses[i]
+        if pose is None:
+            points = self.arrays.keypoints[i].tolist()
+            scores = self.arrays.keypoint_scores[i].tolist()
+            keypoints = {
+                kind: Keypoint(Point(x, y), score)
+                for kind, (x, y), score in zip(_KEYPOINT_TYPES, points, scores)}
+            pose = self._poses[i] = Pose(keypoints, float(self.arrays.scores[i]))
+        return pose
+
 
 class PoseEngine():
     """Engine used for pose tasks."""
@@ -76,6 +118,10 @@ class PoseEngine():
         Raises:
           ValueError: An error occurred when model output is invalid.
         """
+        # the Edge TPU runtime is only needed to run a model, not to import this module
+        from tflite_runtime.interpreter import load_delegate
+        from tflite_runtime.interpreter import Interpreter
+
         edgetpu_delegate = load_delegate(EDGETPU_SHARED_LIB)
         posenet_decoder_delegate = load_delegate(POSENET_SHARED_LIB)
         self._interpreter = Interpreter(
@@ -98,12 +144,14 @@ class PoseEngine():
     def run_inference(self, input_data):
         """Run inference using the zero copy feature from pycoral and returns inference time in ms.
         """
+        from pycoral.utils import edgetpu
+
         start = time.monotonic()
         edgetpu.run_inference(self._interpreter, input_data)
         self._inf_time = time.monotonic() - start
         return (self._inf_time * 1000)
 
-    def DetectPosesInImage(self, img):
+    def DetectPosesInImage(self, img, as_arrays=False):
         """Detects poses in a given image.
 
            For ideal results make sure the image fed to this function is close to the
@@ -112,6 +160,7 @@ class PoseEngine():
 
         Args:
           img: numpy array containing image
+          as_arrays: Return `PoseArrays` instead of `Pose` namedtuples.
         """
         input_details = self._interpreter.get_input_details()
         image_width, image_height = img.size
@@ -125,7 +174,7 @@ class PoseEngine():
             # Assuming to be uint8
             input_data = np.asarray(resized_image)
         self.run_inference(input_data.flatten())
-        return self.ParseOutput()
+        return self.ParseOutputArrays() if as_arrays else self.ParseOutput()
 
     def get_input_tensor_shape(self):
         """Returns input tensor shape."""
@@ -136,21 +185,17 @@ class PoseEngine():
         return np.squeeze(self._interpreter.tensor(
             self._interpreter.get_output_details()[idx]['index'])())
 
+    def ParseOutputArrays(self):
+        """Returns the decoded poses as `PoseArrays` and the inference time."""
+        arrays = parse_poses(
+            self.get_output_tensor(0), self.get_output_tensor(1), self.get_output_tensor(2),
+            self.get_output_tensor(3), self._mirror, self._input_width)
+        return arrays, self._inf_time
+
     def ParseOutput(self):
-        """Parses interpreter output tensors and returns decoded poses."""
-        keypoints = self.get_output_tensor(0)
-        keypoint_scores = self.get_output_tensor(1)
-        pose_scores = self.get_output_tensor(2)
-        num_poses = self.get_output_tensor(3)
-        poses = []
-        for i in range(int(num_poses)):
-            pose_score = pose_scores[i]
-            pose_keypoints = {}
-            for j, point in enumerate(keypoints[i]):
-                y, x = point
-                if self._mirror:
-                    y = self._input_width - y
-                pose_keypoints[KeypointType(j)] = Keypoint(
-                    Point(x, y), keypoint_scores[i, j])
-            poses.append(Pose(pose_keypoints, pose_score))
-        return poses, self._inf_time
\ No newline at end of file
+        """Parses interpreter output tensors and returns decoded poses.
+
+        The poses are a `Poses` view over `ParseOutputArrays`: a `Pose` is only built for the
+        poses that are actually looked at."""
+        arrays, inf_time = self.ParseOutputArrays()
+        return Poses(arrays), inf_time
@@ -1,5 +1,5 @@
 from posenet.constants import *
 from posenet.decode_multi import decode_multiple_poses
-from posenet.models.model_factory import load_model
+from posenet.models.model_factory import load_model, get_model, model_load_times, BACKENDS
 from posenet.models import MobileNetV1, MOBILENET_V1_CHECKPOINTS
 from posenet.utils import *
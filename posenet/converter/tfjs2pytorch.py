@@ -1,9 +1,10 @@
+import concurrent.futures
 import json
-import struct
 import cv2
 import numpy as np
 import os
 import tempfile
+import time
 import torch
 
 from posenet import MobileNetV1, MOBILENET_V1_CHECKPOINTS
@@ -41,7 +42,22 @@ def to_torch_name(tf_name):
     return torch_name
 
 
-def load_variables(chkpoint, base_dir=BASE_DIR):
+def _read_variable(path, shape, depthwise):
+    # tfjs stores little-endian float32; reading into a bytearray gives a writable buffer that
+    # np.frombuffer and torch.from_numpy both wrap without copying
+    buf = bytearray(os.path.getsize(path))
+    with open(path, 'rb') as f:
+        f.readinto(buf)
+    d = np.frombuffer(buf, dtype='<f4')
+    if len(shape) == 4:
+        # a transposed view: load_state_dict copies it into the parameter's layout
+        d = d.reshape(shape).transpose((2, 3, 0, 1) if depthwise else (3, 2, 0, 1))
+    return torch.from_numpy(d)
+
+
+def load_variables(chkpoint, base_dir=BASE_DIR, workers=8):
+    """Name -> tensor dict of tfjs checkpoint `chkpoint` in `base_dir` (downloaded first if
+    missing), with the variable files read by `workers` threads."""
     manifest_path = os.path.join(base_dir, chkpoint, "manifest.json")
     if not os.path.exists(manifest_path):
         print('Weights for checkpoint %s are not downloaded. Downloading to %s ...' % (chkpoint, base_dir))
@@ -49,27 +65,20 @@ def load_variables(chkpoint, base_dir=BASE_DIR):
         download(chkpoint, base_dir)
         assert os.path.exists(manifest_path)
 
-    manifest = open(manifest_path)
-    variables = json.load(manifest)
-    manifest.close()
-
-    state_dict = {}
-    for x in variables:
-        torch_name = to_torch_name(x)
-        if not torch_name:
-            continue
-        filename = variables[x]["filename"]
-        byte = open(os.path.join(base_dir, chkpoint, filename), 'rb').read()
-        fmt = str(int(len(byte) / struct.calcsize('f'))) + 'f'
-        d = struct.unpack(fmt, byte)
-        d = np.array(d, dtype=np.float32)
-        shape = variables[x]["shape"]
-        if len(shape) == 4:
-            tpt = (2, 3, 0, 1) if 'depthwise' in filename else (3, 2, 0, 1)
-            d = np.reshape(d, shape).transpose(tpt)
-        state_dict[torch_name] = torch.Tensor(d)
-
-    return state_dict
+    with open(manifest_path) as manifest:
+        variables = json.load(manifest)
+
+    jobs = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for x in variables:
+            torch_name = to_torch_name(x)
+            if not torch_name:
+                continue
+            filename = variables[x]["filename"]
+            jobs[torch_name] = executor.submit(
+                _read_variable, os.path.join(base_dir, chkpoint, filename), variables[x]["shape"],
+                'depthwise' in filename)
+    return {torch_name: job.result() for torch_name, job in jobs.items()}
 
 
 def _read_imgfile(path, width, height):
@@ -82,7 +91,7 @@ def _read_imgfile(path, width, height):
     return img
 
 
-def convert(model_id, model_dir, output_stride=16, image_size=513, check=True):
+def convert(model_id, model_dir, output_stride=16, image_size=513, check=True, base_dir=BASE_DIR, workers=8):
     checkpoint_name = MOBILENET_V1_CHECKPOINTS[model_id]
     width = image_size
     height = image_size
@@ -90,7 +99,7 @@ def convert(model_id, model_dir, output_stride=16, image_size=513, check=True):
     if not os.path.exists(model_dir):
         os.makedirs(model_dir)
 
-    state_dict = load_variables(checkpoint_name)
+    state_dict = load_variables(checkpoint_name, base_dir, workers)
     m = MobileNetV1(model_id, output_stride=output_stride)
     m.load_state_dict(state_dict)
     checkpoint_path = os.path.join(model_dir, checkpoint_name) + '.pth'
@@ -109,3 +118,30 @@ def convert(model_id, model_dir, output_stride=16, image_size=513, check=True):
         print(heatmaps_result.shape)
         print(heatmaps_result[:, 0:1, 0:1])
         print(torch.mean(heatmaps_result))
+
+    return checkpoint_path
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Converts tfjs PoseNet checkpoints to PyTorch .pth files.')
+    parser.add_argument('--models', type=int, nargs='+', default=sorted(MOBILENET_V1_CHECKPOINTS))
+    parser.add_argument('--model_dir', default='./_models')
+    parser.add_argument('--base_dir', default=BASE_DIR, help='tfjs weights, downloaded here if missing')
+    parser.add_argument('--workers', type=int, default=8, help='threads reading variable files')
+    parser.add_argument('--check', action='store_true')
+    args = parser.parse_args()
+
+    total = time.time()
+    for model_id in args.models:
+        start = time.time()
+        checkpoint_path = convert(
+            model_id, args.model_dir, check=args.check, base_dir=args.base_dir, workers=args.workers)
+        print('%s: %.1f MB in %.3fs' % (
+            checkpoint_path, os.path.getsize(checkpoint_path) / 1e6, time.time() - start))
+    print('%d checkpoints in %.3fs' % (len(args.models), time.time() - total))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,200 @@
-import requests
+import concurrent.futures
+import hashlib
+import io
 import json
-import posixpath
 import os
+import posixpath
+
+import requests
+import requests.adapters
+from urllib.parse import unquote, urlparse
 
 from posenet import MOBILENET_V1_CHECKPOINTS
 
 GOOGLE_CLOUD_STORAGE_DIR = 'https://storage.googleapis.com/tfjs-models/weights/posenet/'
-
-
-def download_json(checkpoint, filename, base_dir):
-
-    url = posixpath.join(GOOGLE_CLOUD_STORAGE_DIR, checkpoint, filename)
-    response = requests.get(url)
-    data = json.loads(response.content)
-
-    with open(os.path.join(base_dir, checkpoint, filename), 'w') as outfile:
-        json.dump(data, outfile)
-
-def download_file(checkpoint, filename, base_dir):
-
-    url = posixpath.join(GOOGLE_CLOUD_STORAGE_DIR, checkpoint, filename)
-    response = requests.get(url)
-    f = open(os.path.join(base_dir, checkpoint, filename), 'wb')
-    f.write(response.content)
-    f.close()
-
-def download(checkpoint, base_dir='./weights/'):
-    save_dir = os.path.join(base_dir, checkpoint)
-    if not os.path.exists(save_dir):
-        os.makedirs(save_dir)
-
-    download_json(checkpoint, 'manifest.json', base_dir)
-
-    f = open(os.path.join(save_dir, 'manifest.json'), 'r')
-    json_dict = json.load(f)
-
-    for x in json_dict:
-        filename = json_dict[x]['filename']
-        print('Downloading', filename)
-        download_file(checkpoint, filename, base_dir)
+# Where checkpoints are fetched from: any http(s):// or file:// root laid out like the bucket
+# (<root>/<checkpoint>/manifest.json and the files it lists)
+MIRROR_ROOT = os.environ.get('POSENET_WEIGHTS_MIRROR', GOOGLE_CLOUD_STORAGE_DIR)
+# Optional per-checkpoint file of "<sha256>  <filename>" lines at the mirror
+CHECKSUMS_FILE = 'SHA256SUMS'
+CHUNK_SIZE = 1 << 16
+
+
+class FileAdapter(requests.adapters.BaseAdapter):
+    """Serves file:// URLs through a requests.Session, including `Range: bytes=N-` requests,
+    so a local mirror goes through the same download and resume code as HTTP."""
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        path = unquote(urlparse(request.url).path)
+        if not os.path.isfile(path):
+            response.status_code = 404
+            response.raw = io.BytesIO(b'')
+            return response
+        size = os.path.getsize(path)
+        start = 0
+        ranged = request.headers.get('Range', '')
+        if ranged.startswith('bytes=') and ranged.endswith('-'):
+            start = int(ranged[len('bytes='):-1])
+        if start >= size and ranged:
+            response.status_code = 416
+            response.raw = io.BytesIO(b'')
+            return response
+        with open(path, 'rb') as f:
+            f.seek(start)
+            response.raw = io.BytesIO(f.read())
+        response.status_code = 206 if ranged else 200
+        response.headers['Content-Length'] = str(size - start)
+        return response
+
+    def close(self):
+        pass
+
+
+class Downloader(object):
+    """Fetches tfjs checkpoints from `mirror` into `base_dir/<checkpoint>/`.
+
+    One pooled `requests.Session` serves up to `workers` concurrent file downloads. Each file is
+    written to `<name>.part` and only renamed into place once complete and verified, so an
+    interrupted download resumes from the bytes already on disk (an HTTP Range request) and a
+    file that is already in place is not fetched again. Files are checked against the size the
+    manifest's shape implies and, when the mirror publishes a `CHECKSUMS_FILE`, their sha256.
+    """
+
+    def __init__(self, mirror=None, workers=4, retries=3, timeout=30.):
+        self.mirror = mirror or MIRROR_ROOT
+        if not self.mirror.endswith('/'):
+            self.mirror += '/'
+        self.workers = workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=workers,
+            max_retries=requests.adapters.Retry(
+                total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504)))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.mount('file://', FileAdapter())
+
+    def url(self, checkpoint, filename):
+        return posixpath.join(self.mirror, checkpoint, filename)
+
+    def fetch(self, url, path, expected_size=None, sha256=None):
+        """Downloads `url` to `path`, resuming a `path.part` left by an earlier attempt.
+        Returns the number of bytes transferred."""
+        if os.path.exists(path) and (expected_size is None or os.path.getsize(path) == expected_size):
+            return 0
+        part_path = path + '.part'
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {'Range': 'bytes=%d-' % offset} if offset else {}
+        transferred = 0
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 416:
+                pass  # the part file already holds the whole file
+            else:
+                response.raise_for_status()
+                # 200 instead of 206: the server ignored the range, start over
+                mode = 'ab' if response.status_code == 206 else 'wb'
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                        transferred += len(chunk)
+        self._check(part_path, url, expected_size, sha256)
+        os.replace(part_path, path)
+        return transferred
+
+    def _check(self, part_path, url, expected_size, sha256):
+        size = os.path.getsize(part_path)
+        if expected_size is not None and size != expected_size:
+            if size > expected_size:
+                os.remove(part_path)  # can't be resumed into the right file
+            raise IOError('%s: got %d bytes, expected %d' % (url, size, expected_size))
+        if sha256 is not None:
+            digest = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            if digest.hexdigest() != sha256:
+                os.remove(part_path)
+                raise IOError('%s: sha256 mismatch' % url)
+
+    def checksums(self, checkpoint):
+        """filename -> sha256 from the mirror's `CHECKSUMS_FILE`, or {} if it has none."""
+        with self.session.get(self.url(checkpoint, CHECKSUMS_FILE), timeout=self.timeout) as response:
+            if response.status_code == 404:
+                return {}
+            response.raise_for_status()
+            sums = {}
+            for line in response.text.splitlines():
+                if line.strip():
+                    digest, filename = line.split(None, 1)
+                    sums[filename.lstrip('*')] = digest
+            return sums
+
+    def download(self, checkpoint, base_dir):
+        save_dir = os.path.join(base_dir, checkpoint)
+        if not os.path.exists(save_dir):
+            os.makedirs(save_dir)
+
+        sums = self.checksums(checkpoint)
+        manifest_path = os.path.join(save_dir, 'manifest.json')
+        self.fetch(self.url(checkpoint, 'manifest.json'), manifest_path, sha256=sums.get('manifest.json'))
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            jobs = []
+            for x in manifest:
+                filename = manifest[x]['filename']
+                size = 4
+                for dim in manifest[x]['shape']:
+                    size *= dim
+                jobs.append((filename, executor.submit(
+                    self.fetch, self.url(checkpoint, filename), os.path.join(save_dir, filename),
+                    size, sums.get(filename))))
+            total = 0
+            for filename, job in jobs:
+                transferred = job.result()
+                total += transferred
+                if transferred:
+                    print('Downloaded', filename)
+        return total
+
+    def close(self):
+        self.session.close()
+
+
+def download(checkpoint, base_dir='./weights/', mirror=None, workers=4):
+    """Downloads tfjs checkpoint `checkpoint` into `base_dir`; see `Downloader`."""
+    downloader = Downloader(mirror, workers)
+    try:
+        return downloader.download(checkpoint, base_dir)
+    finally:
+        downloader.close()
 
 
 def main():
-    checkpoint = MOBILENET_V1_CHECKPOINTS[101]
-    download(checkpoint)
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Downloads the tfjs PoseNet checkpoints.')
+    parser.add_argument('--models', type=int, nargs='+', default=[101])
+    parser.add_argument('--base_dir', default='./weights/')
+    parser.add_argument('--mirror', default=None, help='http(s):// or file:// root (default %s)' % MIRROR_ROOT)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    downloader = Downloader(args.mirror, args.workers)
+    try:
+        for model_id in args.models:
+            start = time.time()
+            checkpoint = MOBILENET_V1_CHECKPOINTS[model_id]
+            transferred = downloader.download(checkpoint, args.base_dir)
+            print('%s: %.1f MB fetched in %.2fs' % (checkpoint, transferred / 1e6, time.time() - start))
+    finally:
+        downloader.close()
 
 
 if __name__ == "__main__":
@@ -67,3 +67,81 @@ def decode_pose(
             instance_keypoint_coords[target_keypoint_id] = coords
 
     return instance_keypoint_scores, instance_keypoint_coords
+
+
+def traverse_to_targ_keypoints(
+        edge_id, source_keypoints, target_keypoint_id, scores, offsets, output_stride, displacements
+):
+    """Vectorized `traverse_to_targ_keypoint` over an (N, 2) array of source keypoints."""
+    height = scores.shape[1]
+    width = scores.shape[2]
+
+    source_keypoint_indices = np.clip(
+        np.round(source_keypoints / output_stride), a_min=0, a_max=[height - 1, width - 1]).astype(np.int32)
+
+    displaced_points = source_keypoints + displacements[
+        edge_id, source_keypoint_indices[:, 0], source_keypoint_indices[:, 1]]
+
+    displaced_point_indices = np.clip(
+        np.round(displaced_points / output_stride), a_min=0, a_max=[height - 1, width - 1]).astype(np.int32)
+
+    score = scores[target_keypoint_id, displaced_point_indices[:, 0], displaced_point_indices[:, 1]]
+
+    image_coords = displaced_point_indices * output_stride + offsets[
+        target_keypoint_id, displaced_point_indices[:, 0], displaced_point_indices[:, 1]]
+
+    return score, image_coords
+
+
+def decode_poses(
+        root_scores, root_ids, root_image_coords,
+        scores,
+        offsets,
+        output_stride,
+        displacements_fwd,
+        displacements_bwd
+):
+    """Vectorized `decode_pose`: decodes one pose per root, walking each edge for all roots at once.
+
+    Returns (N, num_parts) keypoint scores and (N, num_parts, 2) keypoint coords, identical to
+    calling `decode_pose` for every root.
+    """
+    num_roots = len(root_scores)
+    num_parts = scores.shape[0]
+    num_edges = len(PARENT_CHILD_TUPLES)
+
+    instance_keypoint_scores = np.zeros((num_roots, num_parts))
+    instance_keypoint_coords = np.zeros((num_roots, num_parts, 2))
+    rows = np.arange(num_roots)
+    instance_keypoint_scores[rows, root_ids] = root_scores
+    instance_keypoint_coords[rows, root_ids] = root_image_coords
+
+    for edge in reversed(range(num_edges)):
+        target_keypoint_id, source_keypoint_id = PARENT_CHILD_TUPLES[edge]
+        mask = ((instance_keypoint_scores[:, source_keypoint_id] > 0.0) &
+                (instance_keypoint_scores[:, target_keypoint_id] == 0.0))
+        if not mask.any():
+            continue
+        score, coords = traverse_to_targ_keypoints(
+            edge,
+            instance_keypoint_coords[mask, source_keypoint_id],
+            target_keypoint_id,
+            scores, offsets, output_stride, displacements_bwd)
+        instance_keypoint_scores[mask, target_keypoint_id] = score
+        instance_keypoint_coords[mask, target_keypoint_id] = coords
+
+    for edge in range(num_edges):
+        source_keypoint_id, target_keypoint_id = PARENT_CHILD_TUPLES[edge]
+        mask = ((instance_keypoint_scores[:, source_keypoint_id] > 0.0) &
+                (instance_keypoint_scores[:, target_keypoint_id] == 0.0))
+        if not mask.any():
+            continue
+        score, coords = traverse_to_targ_keypoints(
+            edge,
+            instance_keypoint_coords[mask, source_keypoint_id],
+            target_keypoint_id,
+            scores, offsets, output_stride, displacements_fwd)
+        instance_keypoint_scores[mask, target_keypoint_id] = score
+        instance_keypoint_coords[mask, target_keypoint_id] = coords
+
+    return instance_keypoint_scores, instance_keypoint_coords
@@ -60,7 +60,8 @@ def build_part_with_score_torch(score_threshold, local_max_radius, scores):
 
 def decode_multiple_poses(
         scores, offsets, displacements_fwd, displacements_bwd, output_stride,
-        max_pose_detections=10, score_threshold=0.5, nms_radius=20, min_pose_score=0.5):
+        max_pose_detections=10, score_threshold=0.5, nms_radius=20, min_pose_score=0.5,
+        decode_chunk_size=64):
 
     # perform part scoring step on GPU as it's expensive
     # TODO determine how much more of this would be worth performing on the GPU
@@ -82,31 +83,43 @@ def decode_multiple_poses(
     pose_keypoint_scores = np.zeros((max_pose_detections, NUM_KEYPOINTS))
     pose_keypoint_coords = np.zeros((max_pose_detections, NUM_KEYPOINTS, 2))
 
-    for root_score, (root_id, root_coord_y, root_coord_x) in zip(part_scores, part_idx):
-        root_coord = np.array([root_coord_y, root_coord_x])
-        root_image_coords = root_coord * output_stride + offsets[root_id, root_coord_y, root_coord_x]
-
-        if within_nms_radius_fast(
-                pose_keypoint_coords[:pose_count, root_id, :], squared_nms_radius, root_image_coords):
-            continue
-
-        keypoint_scores, keypoint_coords = decode_pose(
-            root_score, root_id, root_image_coords,
+    # Candidate poses are decoded a chunk of roots at a time with array ops; only the cheap NMS /
+    # acceptance pass below still depends on the order of the roots. Chunking keeps the early exit
+    # once max_pose_detections is reached from decoding roots that would never be looked at.
+    for chunk_start in range(0, len(part_scores), decode_chunk_size):
+        chunk_scores = part_scores[chunk_start:chunk_start + decode_chunk_size]
+        chunk_idx = part_idx[chunk_start:chunk_start + decode_chunk_size]
+        root_ids = chunk_idx[:, 0]
+        root_image_coords = chunk_idx[:, 1:] * output_stride + offsets[root_ids, chunk_idx[:, 1], chunk_idx[:, 2]]
+
+        chunk_keypoint_scores, chunk_keypoint_coords = decode_poses(
+            chunk_scores, root_ids, root_image_coords,
             scores, offsets, output_stride,
             displacements_fwd, displacements_bwd)
 
-        pose_score = get_instance_score_fast(
-            pose_keypoint_coords[:pose_count, :, :], squared_nms_radius, keypoint_scores, keypoint_coords)
-
-        # NOTE this isn't in the original implementation, but it appears that by initially ordering by
-        # part scores, and having a max # of detections, we can end up populating the returned poses with
-        # lower scored poses than if we discard 'bad' ones and continue (higher pose scores can still come later).
-        # Set min_pose_score to 0. to revert to original behaviour
-        if min_pose_score == 0. or pose_score >= min_pose_score:
-            pose_scores[pose_count] = pose_score
-            pose_keypoint_scores[pose_count, :] = keypoint_scores
-            pose_keypoint_coords[pose_count, :, :] = keypoint_coords
-            pose_count += 1
+        for ri in range(len(chunk_scores)):
+            if within_nms_radius_fast(
+                    pose_keypoint_coords[:pose_count, root_ids[ri], :], squared_nms_radius, root_image_coords[ri]):
+                continue
+
+            keypoint_scores = chunk_keypoint_scores[ri]
+            keypoint_coords = chunk_keypoint_coords[ri]
+
+            pose_score = get_instance_score_fast(
+                pose_keypoint_coords[:pose_count, :, :], squared_nms_radius, keypoint_scores, keypoint_coords)
+
+            # NOTE this isn't in the original implementation, but it appears that by initially ordering by
+            # part scores, and having a max # of detections, we can end up populating the returned poses with
+            # lower scored poses than if we discard 'bad' ones and continue (higher pose scores can still come later).
+            # Set min_pose_score to 0. to revert to original behaviour
+            if min_pose_score == 0. or pose_score >= min_pose_score:
+                pose_scores[pose_count] = pose_score
+                pose_keypoint_scores[pose_count, :] = keypoint_scores
+                pose_keypoint_coords[pose_count, :, :] = keypoint_coords
+                pose_count += 1
+
+            if pose_count >= max_pose_detections:
+                break
 
         if pose_count >= max_pose_detections:
             break
@@ -0,0 +1,45 @@
+import torch
+
+INPUT_NAME = 'image'
+OUTPUT_NAMES = ('heatmap', 'offset', 'displacement_fwd', 'displacement_bwd')
+
+
+def _example_input():
+    # any valid resolution works: the exported graphs take every (batch, height, width)
+    return torch.zeros(1, 3, 257, 257)
+
+
+def freeze(model):
+    """Traces `model` and freezes it: the weights become constants of the graph, so conv and
+    bias folding and the other inference passes can run on it. The result still takes any
+    input size."""
+    model.eval()
+    with torch.no_grad():
+        return torch.jit.freeze(torch.jit.trace(model, _example_input()))
+
+
+def optimize(frozen):
+    """CPU inference version of a `freeze`d model: convolutions go to MKLDNN with the ReLU6
+    applied to their output in place. Done at load time rather than saved, since the result
+    is tied to this machine's torch build."""
+    return torch.jit.optimize_for_inference(frozen)
+
+
+def export_torchscript(model, path):
+    torch.jit.save(freeze(model), path)
+
+
+def export_onnx(model, path, opset_version=13):
+    """Writes `model` as ONNX for onnxruntime or cv2.dnn, with batch, height and width left
+    dynamic. The input is named `INPUT_NAME` and the outputs `OUTPUT_NAMES`."""
+    model.eval()
+    # the outputs are output_stride times smaller than the input, so their sizes get names of their own
+    dynamic_axes = {INPUT_NAME: {0: 'batch', 2: 'height', 3: 'width'}}
+    for name in OUTPUT_NAMES:
+        dynamic_axes[name] = {0: 'batch', 2: 'output_height', 3: 'output_width'}
+    with torch.no_grad():
+        torch.onnx.export(
+            model, _example_input(), path,
+            input_names=[INPUT_NAME], output_names=list(OUTPUT_NAMES),
+            dynamic_axes=dynamic_axes,
+            opset_version=opset_version, dynamo=False)
@@ -1,6 +1,5 @@
 import torch
 import torch.nn as nn
-import torch.nn.functional as F
 
 from collections import OrderedDict
 
@@ -49,9 +48,14 @@ class InputConv(nn.Module):
         super(InputConv, self).__init__()
         self.conv = nn.Conv2d(
             inp, outp, k, stride, padding=_get_padding(k, stride, dilation), dilation=dilation)
+        self.relu = nn.ReLU6()
 
     def forward(self, x):
-        return F.relu6(self.conv(x))
+        return self.relu(self.conv(x))
+
+    def fusable(self):
+        # (conv, activation) pairs that quantization fuses into one op
+        return [['conv', 'relu']]
 
 
 class SeperableConv(nn.Module):
@@ -60,13 +64,18 @@ class SeperableConv(nn.Module):
         self.depthwise = nn.Conv2d(
             inp, inp, k, stride,
             padding=_get_padding(k, stride, dilation), dilation=dilation, groups=inp)
+        self.depthwise_relu = nn.ReLU6()
         self.pointwise = nn.Conv2d(inp, outp, 1, 1)
+        self.pointwise_relu = nn.ReLU6()
 
     def forward(self, x):
-        x = F.relu6(self.depthwise(x))
-        x = F.relu6(self.pointwise(x))
+        x = self.depthwise_relu(self.depthwise(x))
+        x = self.pointwise_relu(self.pointwise(x))
         return x
 
+    def fusable(self):
+        return [['depthwise', 'depthwise_relu'], ['pointwise', 'pointwise_relu']]
+
 
 MOBILENET_V1_CHECKPOINTS = {
     50: 'mobilenet_v1_050',
@@ -1,23 +1,165 @@
 import torch
+import torch.nn as nn
 import os
+import threading
+import time
 
 
+from posenet.models import export, quantize
 from posenet.models.mobilenet_v1 import MobileNetV1, MOBILENET_V1_CHECKPOINTS
+from posenet.models.weight_store import WeightStore
 
-MODEL_DIR = './_models'
+MODEL_DIR = os.environ.get('POSENET_MODEL_DIR', './_models')
+# Offline: load only what is already in the model directory (weight store files or .pth
+# checkpoints), never download and convert the tfjs weights
+OFFLINE = os.environ.get('POSENET_OFFLINE', '') not in ('', '0')
 DEBUG_OUTPUT = False
 
+# eager: the PyTorch module as is; torchscript: traced, frozen and optimized for CPU inference;
+# onnxruntime / opencv: the exported ONNX graph run by onnxruntime or cv2.dnn; int8: statically
+# quantized (see posenet.models.quantize), the only one whose outputs differ from eager's
+BACKENDS = ('eager', 'torchscript', 'onnxruntime', 'opencv', 'int8')
 
-def load_model(model_id, output_stride=16, model_dir=MODEL_DIR):
-    model_path = os.path.join(model_dir, MOBILENET_V1_CHECKPOINTS[model_id] + '.pth')
-    if not os.path.exists(model_path):
-        print('Cannot find models file %s, converting from tfjs...' % model_path)
-        from posenet.converter.tfjs2pytorch import convert
-        convert(model_id, model_dir, check=False)
-        assert os.path.exists(model_path)
+_model_cache = {}
+_model_load_times = {}
+_model_cache_lock = threading.Lock()
 
-    model = MobileNetV1(model_id, output_stride=output_stride)
-    load_dict = torch.load(model_path)
-    model.load_state_dict(load_dict)
 
+class TorchScriptModel(nn.Module):
+    def __init__(self, scripted, output_stride):
+        super(TorchScriptModel, self).__init__()
+        self.scripted = scripted
+        self.output_stride = output_stride
+
+    def forward(self, x):
+        return self.scripted(x)
+
+
+class OnnxRuntimeModel(nn.Module):
+    def __init__(self, onnx_path, output_stride):
+        super(OnnxRuntimeModel, self).__init__()
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("the onnxruntime backend needs the onnxruntime package (pip install onnxruntime)")
+        self.session = onnxruntime.InferenceSession(onnx_path, providers=['CPUExecutionProvider'])
+        self.output_stride = output_stride
+
+    def forward(self, x):
+        outputs = self.session.run(list(export.OUTPUT_NAMES), {export.INPUT_NAME: x.contiguous().numpy()})
+        return tuple(torch.from_numpy(o) for o in outputs)
+
+
+class OpenCVModel(nn.Module):
+    def __init__(self, onnx_path, output_stride):
+        super(OpenCVModel, self).__init__()
+        self.onnx_path = onnx_path
+        self.output_stride = output_stride
+        # a cv2.dnn.Net keeps its input and activations on itself: one per calling thread
+        self._local = threading.local()
+
+    def forward(self, x):
+        import cv2
+
+        net = getattr(self._local, 'net', None)
+        if net is None:
+            net = self._local.net = cv2.dnn.readNetFromONNX(self.onnx_path)
+        net.setInput(x.contiguous().numpy())
+        return tuple(torch.from_numpy(o) for o in net.forward(list(export.OUTPUT_NAMES)))
+
+
+def _export_int8(model, path):
+    inputs = quantize.calibration_inputs()
+    torch.jit.save(export.freeze(quantize.quantize_static(model, inputs)), path)
+
+
+def _exported(model, model_path, suffix, write):
+    # exports are kept next to the checkpoint and redone whenever the checkpoint is newer
+    path = '%s_s%d%s' % (os.path.splitext(model_path)[0], model.output_stride, suffix)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(model_path):
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        write(model, tmp_path)
+        os.replace(tmp_path, path)
+    return path
+
+
+def load_weights(model_id, model_dir=MODEL_DIR, offline=None):
+    """`(state_dict, weights_path)` of checkpoint `model_id` from the `WeightStore` in
+    `model_dir`. A checkpoint missing from the store, or older than `<name>.pth` in `model_dir`,
+    is imported from that file, which unless `offline` (default `OFFLINE`) is converted from the
+    tfjs weights first if missing too."""
+    if offline is None:
+        offline = OFFLINE
+    name = MOBILENET_V1_CHECKPOINTS[model_id]
+    store = WeightStore(model_dir)
+    pth_path = os.path.join(model_dir, name + '.pth')
+    # a .pth newer than the store (e.g. just reconverted) replaces it
+    stale = store.contains(name) and os.path.exists(pth_path) and \
+        os.path.getmtime(pth_path) > os.path.getmtime(store.paths(name)[0])
+    if stale or not store.contains(name):
+        if not os.path.exists(pth_path):
+            if offline:
+                raise IOError('offline and no weights for %s in %s (expected %s or %s)' % (
+                    name, model_dir, os.path.basename(store.paths(name)[0]), os.path.basename(pth_path)))
+            print('Cannot find models file %s, converting from tfjs...' % pth_path)
+            from posenet.converter.tfjs2pytorch import convert
+            convert(model_id, model_dir, check=False)
+            assert os.path.exists(pth_path)
+        store.put(name, torch.load(pth_path))
+    return store.get(name), store.paths(name)[0]
+
+
+def load_model(model_id, output_stride=16, model_dir=MODEL_DIR, backend='eager', offline=None):
+    """Loads the PoseNet MobileNetV1 checkpoint `model_id` for one of `BACKENDS`.
+
+    Every backend returns an nn.Module with an `output_stride` attribute that maps a
+    (n, 3, H, W) float32 tensor to the `(heatmap, offset, displacement_fwd, displacement_bwd)`
+    tensors of the eager model. The TorchScript, ONNX and int8 exports are written to `model_dir`
+    on first use; the int8 one is calibrated on `quantize.CALIBRATION_VIDEOS`. Eager weights
+    are views of the memory-mapped weight store (see `load_weights`).
+    """
+    if backend not in BACKENDS:
+        raise ValueError("unknown backend %r, expected one of %s" % (backend, ", ".join(BACKENDS)))
+    state_dict, model_path = load_weights(model_id, model_dir, offline)
+    # built without storage (no random init to throw away), then handed the mapped tensors as its
+    # parameters instead of copying them into fresh ones
+    with torch.device('meta'):
+        model = MobileNetV1(model_id, output_stride=output_stride)
+    model.load_state_dict(state_dict, assign=True)
+    model.eval()
+
+    if backend == 'torchscript':
+        scripted = torch.jit.load(_exported(model, model_path, '.pt', export.export_torchscript))
+        return TorchScriptModel(export.optimize(scripted), output_stride)
+    if backend == 'int8':
+        int8_path = _exported(model, model_path, '_int8.pt', _export_int8)
+        # packed int8 weights are rebuilt for the kernel library selected at load time
+        torch.backends.quantized.engine = quantize.engine()
+        return TorchScriptModel(torch.jit.load(int8_path), output_stride)
+    if backend in ('onnxruntime', 'opencv'):
+        onnx_path = _exported(model, model_path, '.onnx', export.export_onnx)
+        return (OnnxRuntimeModel if backend == 'onnxruntime' else OpenCVModel)(onnx_path, output_stride)
     return model
+
+
+def get_model(model_id, output_stride=16, model_dir=MODEL_DIR, backend='eager'):
+    """Returns the process-wide model for (model_id, output_stride, backend), loading it on first use.
+
+    The model is put in eval() mode and shared by every caller, so it must only be used for
+    inference under torch.no_grad().
+    """
+    key = (model_id, output_stride, backend)
+    with _model_cache_lock:
+        if key not in _model_cache:
+            start = time.time()
+            model = load_model(model_id, output_stride=output_stride, model_dir=model_dir, backend=backend)
+            model.eval()
+            _model_cache[key] = model
+            _model_load_times[key] = time.time() - start
+        return _model_cache[key]
+
+
+def model_load_times():
+    """Seconds spent loading each cached model, keyed by (model_id, output_stride, backend)."""
+    with _model_cache_lock:
+        return dict(_model_load_times)
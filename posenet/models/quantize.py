@@ -0,0 +1,105 @@
+import copy
+import os
+
+import torch
+import torch.nn as nn
+import torch.ao.nn.intrinsic as nni
+import torch.ao.quantization as tq
+
+# Frames the activation ranges are calibrated on: the dance videos bundled at the repo root,
+# found from here rather than the working directory
+_REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CALIBRATION_VIDEOS = tuple(os.path.join(_REPO_DIR, name) for name in ('test.mp4', 'left.mp4', 'right.mp4'))
+
+
+def engine():
+    """Quantized kernel library to run with. oneDNN has fast int8 depthwise convolutions with
+    dilation, which MobileNetV1 uses past output stride 16; fbgemm/x86 fall back to a slow
+    path for those (~190 ms instead of ~2 ms for the 1024-channel layer)."""
+    engines = torch.backends.quantized.supported_engines
+    return 'onednn' if 'onednn' in engines else torch.backends.quantized.engine
+
+
+class _ReLU6Observer(tq.MinMaxObserver):
+    # output range of a fused conv + ReLU6: the fused kernel only applies the ReLU, and the 6 cap
+    # comes from quantizing into a range that ends at or below 6, so calibrate on capped values
+    # (the returned tensor also feeds the next layer during calibration)
+    def forward(self, x):
+        return super(_ReLU6Observer, self).forward(x.clamp(max=6.))
+
+
+def _fuse_conv_relu6(is_qat, conv, relu6):
+    return nni.ConvReLU2d(conv, nn.ReLU())
+
+
+class QuantizedMobileNetV1(nn.Module):
+    """MobileNetV1 with int8 features and heads: the input is quantized on the way in and the
+    four head outputs are dequantized before the heatmap sigmoid, so it takes and returns the
+    same float tensors as the fp32 model."""
+
+    def __init__(self, model):
+        super(QuantizedMobileNetV1, self).__init__()
+        self.output_stride = model.output_stride
+        self.quant = tq.QuantStub()
+        self.features = model.features
+        self.heatmap = model.heatmap
+        self.offset = model.offset
+        self.displacement_fwd = model.displacement_fwd
+        self.displacement_bwd = model.displacement_bwd
+        self.dequant = tq.DeQuantStub()
+
+    def forward(self, x):
+        x = self.features(self.quant(x))
+        heatmap = torch.sigmoid(self.dequant(self.heatmap(x)))
+        offset = self.dequant(self.offset(x))
+        displacement_fwd = self.dequant(self.displacement_fwd(x))
+        displacement_bwd = self.dequant(self.displacement_bwd(x))
+        return heatmap, offset, displacement_fwd, displacement_bwd
+
+
+def calibration_inputs(paths=CALIBRATION_VIDEOS, every=10, limit=12, scale_factors=(1.0, 0.5)):
+    """Preprocessed model inputs from every `every`-th frame of each video (at most `limit` per
+    video), at each of `scale_factors`."""
+    import imageio
+    from posenet.utils import _process_input
+
+    inputs = []
+    for path in paths:
+        reader = imageio.get_reader(path, 'ffmpeg')
+        try:
+            for i, frame in enumerate(reader):
+                if i // every >= limit:
+                    break
+                if i % every == 0:
+                    inputs.extend(_process_input(frame, scale_factor)[0] for scale_factor in scale_factors)
+        finally:
+            reader.close()
+    return inputs
+
+
+def quantize_static(model, inputs):
+    """Post-training static quantization of a fp32 `MobileNetV1`, which is left untouched.
+
+    Every conv + ReLU6 is fused into one int8 op, weights are quantized per output channel and
+    activation ranges are taken from running the (n, 3, H, W) float32 `inputs` through it."""
+    torch.backends.quantized.engine = engine()
+    quantized = QuantizedMobileNetV1(copy.deepcopy(model)).eval()
+    fuser = {'additional_fuser_method_mapping': {(nn.Conv2d, nn.ReLU6): _fuse_conv_relu6}}
+    for block in quantized.features.children():
+        tq.fuse_modules(block, block.fusable(), inplace=True, fuse_custom_config_dict=fuser)
+
+    qconfig = tq.get_default_qconfig(engine())
+    # fbgemm needs activations one bit short of 8 to avoid overflowing its int16 accumulation
+    relu6_observer = _ReLU6Observer.with_args(dtype=torch.quint8, reduce_range=engine() in ('x86', 'fbgemm'))
+    relu6_qconfig = tq.QConfig(activation=relu6_observer, weight=qconfig.weight)
+    quantized.qconfig = qconfig
+    for module in quantized.features.modules():
+        if isinstance(module, nni.ConvReLU2d):
+            module.qconfig = relu6_qconfig
+
+    tq.prepare(quantized, inplace=True)
+    with torch.no_grad():
+        for input_image in inputs:
+            quantized(torch.from_numpy(input_image))
+    tq.convert(quantized, inplace=True)
+    return quantized
@@ -0,0 +1,123 @@
+import collections
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import torch
+
+# Tensor data starts on this boundary in the weights file
+ALIGNMENT = 64
+FORMAT_VERSION = 1
+
+
+class WeightStore(object):
+    """Converted checkpoints kept as one flat float32 file each, loaded by memory-mapping it.
+
+    `<name>.weights` holds every tensor back to back and `<name>.json` their names, shapes and
+    offsets plus the file's sha256. `get` maps the file copy-on-write and returns tensors that
+    are views of the mapping, so loading costs no reads and every process that loads the same
+    checkpoint (e.g. gunicorn workers) shares its pages through the page cache until one writes.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def paths(self, name):
+        base = os.path.join(self.root, name)
+        return base + '.weights', base + '.json'
+
+    def contains(self, name):
+        return all(os.path.exists(p) for p in self.paths(name))
+
+    def put(self, name, state_dict):
+        """Writes `state_dict` (name -> float tensor) as checkpoint `name`, replacing any old one."""
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        weights_path, index_path = self.paths(name)
+        tensors = collections.OrderedDict()
+        digest = hashlib.sha256()
+        tmp_suffix = '.%d.tmp' % os.getpid()
+        with open(weights_path + tmp_suffix, 'wb') as f:
+            offset = 0
+            for key, tensor in state_dict.items():
+                data = tensor.detach().cpu().numpy().astype(np.float32, copy=False)
+                padding = b'\0' * (-offset % ALIGNMENT)
+                f.write(padding)
+                digest.update(padding)
+                offset += len(padding)
+                buf = np.ascontiguousarray(data).tobytes()
+                f.write(buf)
+                digest.update(buf)
+                tensors[key] = {'offset': offset, 'shape': list(data.shape)}
+                offset += len(buf)
+        index = {'version': FORMAT_VERSION, 'size': offset, 'sha256': digest.hexdigest(), 'tensors': tensors}
+        with open(index_path + tmp_suffix, 'w') as f:
+            json.dump(index, f, indent=1)
+        # the index goes last: a crash in between leaves a weights file the old index rejects
+        os.replace(weights_path + tmp_suffix, weights_path)
+        os.replace(index_path + tmp_suffix, index_path)
+
+    def get(self, name, verify=True):
+        """Checkpoint `name` as an ordered name -> tensor dict backed by the mapped file.
+
+        With `verify` the file's sha256 is checked against the index (once per file per process)
+        and an IOError raised on mismatch."""
+        weights_path, index_path = self.paths(name)
+        with open(index_path) as f:
+            index = json.load(f)
+        if index.get('version') != FORMAT_VERSION:
+            raise IOError('%s: unsupported weight store version %r' % (index_path, index.get('version')))
+        if os.path.getsize(weights_path) != index['size']:
+            raise IOError('%s is corrupt: %d bytes, expected %d' % (
+                weights_path, os.path.getsize(weights_path), index['size']))
+
+        # copy-on-write: pages stay shared with other processes unless a tensor is written to
+        mapped = np.memmap(weights_path, dtype=np.uint8, mode='c')
+        if verify:
+            _verify(weights_path, mapped, index['sha256'])
+        state_dict = collections.OrderedDict()
+        for key, entry in index['tensors'].items():
+            count = int(np.prod(entry['shape']))
+            data = mapped[entry['offset']:entry['offset'] + 4 * count].view(np.float32)
+            state_dict[key] = torch.from_numpy(data.reshape(entry['shape']))
+        return state_dict
+
+
+_verified = set()
+_verified_lock = threading.Lock()
+
+
+def _verify(path, mapped, sha256):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, sha256)
+    with _verified_lock:
+        if key in _verified:
+            return
+    if hashlib.sha256(memoryview(mapped)).hexdigest() != sha256:
+        raise IOError('%s is corrupt: sha256 does not match its index' % path)
+    with _verified_lock:
+        _verified.add(key)
+
+
+def main():
+    """Fills a model directory's weight store with every checkpoint, e.g. to seed the directory
+    an offline node will load from (POSENET_MODEL_DIR with POSENET_OFFLINE=1)."""
+    import argparse
+    import time
+    from posenet.models.model_factory import MODEL_DIR, load_weights
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model_dir', default=MODEL_DIR)
+    parser.add_argument('--models', type=int, nargs='+', default=[50, 75, 100, 101])
+    parser.add_argument('--offline', action='store_true', help='only import .pth files already in --model_dir')
+    args = parser.parse_args()
+    for model_id in args.models:
+        start = time.time()
+        _, weights_path = load_weights(model_id, args.model_dir, offline=args.offline)
+        print('%s ready in %.2fs' % (weights_path, time.time() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import collections
+
 import cv2
 import numpy as np
 
@@ -10,18 +12,68 @@ def valid_resolution(width, height, output_stride=16):
     return target_width, target_height
 
 
+def _normalize_into(resized, out):
+    # BGR -> RGB, HWC -> CHW and [0, 255] -> [-1, 1] in two in-place passes over `out`: the channel
+    # swap and transpose are just a strided view of `resized`, read directly by the multiply
+    chw = resized.transpose((2, 0, 1))[::-1]
+    np.multiply(chw, np.float32(2.0 / 255.0), out=out, dtype=np.float32, casting='unsafe')
+    np.subtract(out, np.float32(1.0), out=out)
+    return out
+
+
 def _process_input(source_img, scale_factor=1.0, output_stride=16):
     target_width, target_height = valid_resolution(
         source_img.shape[1] * scale_factor, source_img.shape[0] * scale_factor, output_stride=output_stride)
     scale = np.array([source_img.shape[0] / target_height, source_img.shape[1] / target_width])
 
-    input_img = cv2.resize(source_img, (target_width, target_height), interpolation=cv2.INTER_LINEAR)
-    input_img = cv2.cvtColor(input_img, cv2.COLOR_BGR2RGB).astype(np.float32)
-    input_img = input_img * (2.0 / 255.0) - 1.0
-    input_img = input_img.transpose((2, 0, 1)).reshape(1, 3, target_height, target_width)
+    resized = cv2.resize(source_img, (target_width, target_height), interpolation=cv2.INTER_LINEAR)
+    input_img = np.empty((1, 3, target_height, target_width), dtype=np.float32)
+    _normalize_into(resized, input_img[0])
     return input_img, source_img, scale
 
 
+class Preprocessor(object):
+    """`_process_input` for a stream of frames, without per-frame allocations.
+
+    The resized image and the float32 model input are written into buffers kept per input
+    resolution (the `max_resolutions` most recently used), and the input buffer has `batch_size`
+    slots, so a whole batch is one contiguous array that `torch.from_numpy` can wrap without a
+    copy. A slot is overwritten by the next frame processed into it: run the model on a batch
+    before preprocessing the next one.
+    """
+
+    def __init__(self, batch_size=1, output_stride=16, max_resolutions=4):
+        self.batch_size = batch_size
+        self.output_stride = output_stride
+        self.max_resolutions = max_resolutions
+        self._buffers = collections.OrderedDict()
+
+    def buffers(self, target_height, target_width):
+        """`(resized, inputs)` buffers for one input resolution: (H, W, 3) uint8 and
+        (batch_size, 3, H, W) float32."""
+        key = (target_height, target_width)
+        if key in self._buffers:
+            self._buffers.move_to_end(key)
+        else:
+            self._buffers[key] = (
+                np.empty((target_height, target_width, 3), dtype=np.uint8),
+                np.empty((self.batch_size, 3, target_height, target_width), dtype=np.float32))
+            if len(self._buffers) > self.max_resolutions:
+                self._buffers.popitem(last=False)
+        return self._buffers[key]
+
+    def process(self, source_img, scale_factor=1.0, slot=0):
+        """Same result as `_process_input`, with the input a (1, 3, H, W) view of `slot`."""
+        target_width, target_height = valid_resolution(
+            source_img.shape[1] * scale_factor, source_img.shape[0] * scale_factor, output_stride=self.output_stride)
+        scale = np.array([source_img.shape[0] / target_height, source_img.shape[1] / target_width])
+
+        resized, inputs = self.buffers(target_height, target_width)
+        cv2.resize(source_img, (target_width, target_height), dst=resized, interpolation=cv2.INTER_LINEAR)
+        _normalize_into(resized, inputs[slot])
+        return inputs[slot:slot + 1], source_img, scale
+
+
 def read_cap(cap, scale_factor=1.0, output_stride=16):
     res, img = cap.read()
     if not res:
@@ -34,6 +86,23 @@ def read_imgfile(path, scale_factor=1.0, output_stride=16):
     return _process_input(img, scale_factor, output_stride)
 
 
+def person_box(keypoint_scores, keypoint_coords, image_shape, padding=0.5, min_part_score=0.25, min_parts=5):
+    """Pixel box `(y0, x0, y1, x1)` around one pose's confident keypoints, grown by `padding`
+    times its size on every side and clipped to the image; None if fewer than `min_parts`
+    keypoints reach `min_part_score`."""
+    confident = keypoint_coords[keypoint_scores >= min_part_score]
+    if len(confident) < min_parts:
+        return None
+    low = confident.min(axis=0)
+    high = confident.max(axis=0)
+    pad = np.maximum((high - low) * padding, 16.)
+    y0, x0 = np.maximum(low - pad, 0).astype(int)
+    y1, x1 = np.minimum(high + pad, image_shape[:2]).astype(int)
+    if y1 <= y0 or x1 <= x0:
+        return None
+    return y0, x0, y1, x1
+
+
 def draw_keypoints(
         img, instance_scores, keypoint_scores, keypoint_coords,
         min_pose_confidence=0.5, min_part_confidence=0.5):
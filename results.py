@@ -0,0 +1,94 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+
+RESULT_FILE = 'result.json'
+
+
+class ResultStore(object):
+    """Keeps every job's outputs (scores, overlay videos, plots) in its own directory.
+
+    Directories live under `root` (inside `static/` so Flask can serve them directly) and are
+    removed once unused for `ttl` seconds, or least-recently-viewed first when there are more
+    than `max_jobs`.
+    """
+
+    def __init__(self, root='static/results', ttl=24 * 3600, max_jobs=100):
+        self.root = root
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        if not os.path.exists(root):
+            os.makedirs(root)
+
+    def job_dir(self, job_id):
+        """Returns (and creates) the directory holding `job_id`'s outputs."""
+        path = self._dir(job_id)
+        if not os.path.exists(path):
+            os.makedirs(path)
+        return path
+
+    def path(self, job_id, name):
+        return os.path.join(self.job_dir(job_id), name)
+
+    def url_path(self, job_id, name):
+        """Path of an output relative to `root`, for url_for('static', ...) style links."""
+        return '/'.join([os.path.basename(self.root), job_id, name])
+
+    def save_result(self, job_id, result):
+        """Stores the job's JSON result (numpy arrays and NaN allowed) and returns it as saved."""
+        result = _json_safe(result)
+        with open(self.path(job_id, RESULT_FILE), 'w') as f:
+            json.dump(result, f)
+        return result
+
+    def load_result(self, job_id):
+        """Returns the job's stored result, or None if the job has no (complete) results."""
+        if not _valid_job_id(job_id):
+            return None
+        path = self._dir(job_id)
+        if not os.path.exists(os.path.join(path, RESULT_FILE)):
+            return None
+        # viewing a result counts as a use for LRU/TTL purposes
+        os.utime(path, None)
+        with open(os.path.join(path, RESULT_FILE)) as f:
+            return json.load(f)
+
+    def cleanup(self):
+        """Drops expired results, then the least recently used ones above `max_jobs`."""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for name in os.listdir(self.root):
+                path = os.path.join(self.root, name)
+                if os.path.isdir(path):
+                    entries.append((os.path.getmtime(path), path))
+            entries.sort(reverse=True)
+            for i, (mtime, path) in enumerate(entries):
+                if now - mtime > self.ttl or i >= self.max_jobs:
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def _dir(self, job_id):
+        if not _valid_job_id(job_id):
+            raise ValueError('invalid job id %r' % job_id)
+        return os.path.join(self.root, job_id)
+
+
+def _json_safe(value):
+    # NaN (e.g. a frame without a pose) isn't valid JSON: store it as null
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_json_safe(v) for v in value]
+    value = float(value)
+    return value if value == value else None
+
+
+def _valid_job_id(job_id):
+    # job ids are uuid4 hex strings; anything else must not reach the filesystem
+    return bool(job_id) and all(c in '0123456789abcdef' for c in job_id)
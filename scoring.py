@@ -0,0 +1,87 @@
+import numpy as np
+
+
+EPS = 1e-6
+
+
+def _has_pose(keypoints):
+    # frames where PoseNet found nobody come through as all-zero keypoints
+    return np.any(keypoints != 0, axis=(1, 2))
+
+
+def normalize_poses(keypoints, weights=None):
+    """Mean-centers each (17, 2) pose and scales it to unit L2 norm, for a (T, 17, 2) array.
+
+    With (T, 17) `weights` the center is the weighted mean and the norm the weighted norm.
+    """
+    keypoints = np.asarray(keypoints, dtype=np.float64)
+    num_joints = keypoints.shape[1]
+    # reductions over the joint axis go through matmul/einsum: plain .mean(axis=1) on a
+    # (T, 17, 2) array is several times slower
+    if weights is None:
+        center = np.matmul(np.full(num_joints, 1. / num_joints), keypoints)[:, None, :]
+        centered = keypoints - center
+        norms = np.sqrt(np.einsum('tjc,tjc->t', centered, centered))
+    else:
+        weights = np.asarray(weights, dtype=np.float64)
+        w = weights / (weights.sum(axis=1, keepdims=True) + EPS)
+        center = np.matmul(w[:, None, :], keypoints)
+        centered = keypoints - center
+        norms = np.sqrt(np.sum(weights * _joint_dot(centered, centered), axis=1))
+    centered /= norms[:, None, None] + EPS
+    return centered
+
+
+def _joint_dot(a, b):
+    # (T, 17) dot products of matching joints
+    return np.einsum('tjc,tjc->tj', a, b)
+
+
+def cosine_scores(kp_a, kp_b):
+    """Per-frame cosine similarity of the centered, normalized poses; NaN where either is missing."""
+    scores = np.einsum('tjc,tjc->t', normalize_poses(kp_a), normalize_poses(kp_b))
+    scores[~(_has_pose(kp_a) & _has_pose(kp_b))] = np.nan
+    return scores
+
+
+def weighted_cosine_scores(kp_a, kp_b, conf_a, conf_b):
+    """Per-frame cosine similarity where each joint counts by the confidence of both detections.
+
+    Joints PoseNet is unsure about in either video barely move the score.
+    """
+    weights = np.sqrt(np.asarray(conf_a, dtype=np.float64) * np.asarray(conf_b, dtype=np.float64))
+    scores = np.sum(weights * _joint_dot(normalize_poses(kp_a, weights), normalize_poses(kp_b, weights)), axis=1)
+    scores[~(_has_pose(kp_a) & _has_pose(kp_b))] = np.nan
+    return scores
+
+
+def joint_errors(kp_a, kp_b):
+    """(T, 17) Euclidean distance between matching joints of the normalized poses."""
+    diff = normalize_poses(kp_a) - normalize_poses(kp_b)
+    errors = np.sqrt(_joint_dot(diff, diff))
+    errors[~(_has_pose(kp_a) & _has_pose(kp_b))] = np.nan
+    return errors
+
+
+def score_poses(kp_a, kp_b, conf_a=None, conf_b=None):
+    """Scores two aligned (T, 17, 2) keypoint tracks in one vectorized pass.
+
+    Returns a dict with the per-frame `cosine` scores, the confidence-`weighted` scores (when
+    (T, 17) keypoint confidences are given) and the (T, 17) per-joint `joint_errors`.
+    """
+    kp_a = np.asarray(kp_a, dtype=np.float64)
+    kp_b = np.asarray(kp_b, dtype=np.float64)
+    missing = ~(_has_pose(kp_a) & _has_pose(kp_b))
+    # normalize once and share between the cosine and per-joint outputs
+    norm_a = normalize_poses(kp_a)
+    norm_b = normalize_poses(kp_b)
+
+    cosine = np.einsum('tjc,tjc->t', norm_a, norm_b)
+    cosine[missing] = np.nan
+    diff = norm_a - norm_b
+    errors = np.sqrt(_joint_dot(diff, diff))
+    errors[missing] = np.nan
+    result = {'cosine': cosine, 'joint_errors': errors}
+    if conf_a is not None and conf_b is not None:
+        result['weighted'] = weighted_cosine_scores(kp_a, kp_b, conf_a, conf_b)
+    return result
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import alignment
+
+
+def _shifted_pair(lag, length=300, max_lag=100, channels=1, seed=0):
+    # two windows of one random envelope such that a[t] == b[t + lag]
+    rng = np.random.RandomState(seed)
+    envelope = rng.exponential(1., (length + 2 * max_lag, channels))
+    a = envelope[max_lag:max_lag + length]
+    b = envelope[max_lag - lag:max_lag - lag + length]
+    return a, b
+
+
+@pytest.mark.parametrize('lag', [0, 1, -1, 7, -13, 45, -90, 99, -99])
+def test_estimate_offset_recovers_known_lag(lag):
+    a, b = _shifted_pair(lag)
+    found, confidence = alignment.estimate_offset([(a[:, 0], b[:, 0])], max_lag=100)
+    assert found == lag
+    assert confidence > 0.5
+
+
+@pytest.mark.parametrize('lag', [12, -30])
+def test_estimate_offset_averages_signal_pairs(lag):
+    # a multi-channel signal plus an unrelated one: the shared lag still wins
+    a, b = _shifted_pair(lag, channels=4, seed=1)
+    noise_a, noise_b = np.random.RandomState(2).rand(2, len(a))
+    found, _ = alignment.estimate_offset([(a, b), (noise_a, noise_b)], max_lag=60)
+    assert found == lag
+
+
+@pytest.mark.parametrize('lag', [0, 7, -13])
+def test_apply_offset_lines_up_shifted_tracks(lag):
+    a, b = _shifted_pair(lag)
+    trimmed_a, trimmed_b = alignment.apply_offset(a, b, lag)
+    assert len(trimmed_a) == len(trimmed_b) == len(a) - abs(lag)
+    np.testing.assert_array_equal(trimmed_a, trimmed_b)
+
+
+@pytest.mark.parametrize('lag', [300, -300, 500, -500])
+def test_apply_offset_without_overlap_is_empty(lag):
+    a, b = _shifted_pair(0)
+    trimmed_a, trimmed_b = alignment.apply_offset(a, b, lag)
+    assert len(trimmed_a) == len(trimmed_b) == 0
+
+
+def test_cross_correlation_is_zero_where_signals_do_not_overlap():
+    a = np.random.RandomState(3).rand(20)
+    b = np.random.RandomState(4).rand(30)
+    lags, values = alignment.cross_correlation(a, b, max_lag=40)
+    # b[t + lag] exists for some t in [0, 20) only when -20 < lag < 30
+    no_overlap = (lags <= -20) | (lags >= 30)
+    assert no_overlap.any()
+    assert np.all(values[no_overlap] == 0)
+    assert np.all(values[~no_overlap] != 0)
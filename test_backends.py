@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+import torch
+
+import posenet
+from posenet.models.export import OUTPUT_NAMES
+
+MODEL_ID = 101
+# int8 is left out: its outputs differ from eager's by design (see benchmark.py quantize)
+BACKENDS = ('torchscript', 'onnxruntime', 'opencv')
+REQUIRES = {'onnxruntime': 'onnxruntime', 'opencv': 'cv2'}
+
+
+def _load(backend):
+    try:
+        return posenet.load_model(MODEL_ID, backend=backend, offline=True)
+    except IOError as e:
+        pytest.skip(str(e))
+
+
+@pytest.fixture(scope='module')
+def image():
+    # a fixed input at a resolution other than the one the exports were traced at
+    return torch.from_numpy(np.random.RandomState(0).uniform(-1., 1., (2, 3, 241, 321)).astype(np.float32))
+
+
+@pytest.fixture(scope='module')
+def reference(image):
+    with torch.no_grad():
+        return [r.numpy() for r in _load('eager')(image)]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_backend_matches_eager(backend, image, reference):
+    if backend in REQUIRES:
+        pytest.importorskip(REQUIRES[backend])
+    model = _load(backend)
+    assert model.output_stride == 16
+    with torch.no_grad():
+        outputs = [r.numpy() for r in model(image)]
+    assert len(outputs) == len(OUTPUT_NAMES)
+    for name, expected, actual in zip(OUTPUT_NAMES, reference, outputs):
+        assert actual.shape == expected.shape, name
+        np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-4, err_msg=name)
@@ -0,0 +1,50 @@
+import os
+import threading
+import time
+
+import jobs
+
+
+def _wait(job_queue, job_id, timeout=10.):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        state = job_queue.get(job_id)
+        if state['status'] in (jobs.DONE, jobs.FAILED):
+            return state
+        time.sleep(0.01)
+    raise AssertionError('job %s still %s after %gs' % (job_id, state['status'], timeout))
+
+
+def test_cleanup_expires_finished_jobs_and_their_files(tmp_path):
+    job_queue = jobs.JobQueue(state_dir=str(tmp_path), ttl=60)
+    old = job_queue.submit(lambda job: {'frames': list(range(1000))})
+    _wait(job_queue, old.id)
+    # a job another worker process finished long ago
+    stale = tmp_path / ('ab' * 16 + '.json')
+    stale.write_text('{"status": "done"}')
+    long_ago = time.time() - 120
+    old.updated = long_ago
+    for path in (tmp_path / (old.id + '.json'), stale):
+        os.utime(str(path), (long_ago, long_ago))
+
+    release = threading.Event()
+    running = job_queue.submit(lambda job: release.wait(10))
+    recent = job_queue.submit(lambda job: 1)
+    job_queue.cleanup()
+
+    assert job_queue.get(old.id) is None
+    assert not stale.exists()
+    # unfinished jobs are kept whatever their age
+    assert job_queue.get(running.id)['status'] in (jobs.QUEUED, jobs.RUNNING)
+    assert job_queue.get(recent.id) is not None
+    release.set()
+    assert _wait(job_queue, recent.id)['result'] == 1
+
+
+def test_cleanup_without_ttl_keeps_everything(tmp_path):
+    job_queue = jobs.JobQueue(state_dir=str(tmp_path))
+    job = job_queue.submit(lambda job: 1)
+    _wait(job_queue, job.id)
+    job.updated = 0.
+    job_queue.cleanup()
+    assert job_queue.get(job.id)['result'] == 1
@@ -0,0 +1,62 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import jobs
+import pipeline
+import video_io
+
+
+def _frames(count, shape=(32, 48, 3)):
+    for i in range(count):
+        yield np.full(shape, i % 256, np.uint8)
+
+
+def _wait(job_queue, job_id, timeout=30.):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        state = job_queue.get(job_id)
+        if state['status'] in (jobs.DONE, jobs.FAILED):
+            return state
+        time.sleep(0.05)
+    raise AssertionError('job %s still %s after %gs' % (job_id, state['status'], timeout))
+
+
+def test_split_stops_when_a_stream_is_closed_unread():
+    # more items than the queues hold: the producer needs every stream to keep reading
+    streams = pipeline.split(((i, i) for i in range(100)), 2, maxsize=2)
+    streams[0].close()
+    # stream 1 ends early instead of blocking on stream 0's full queue
+    items = []
+    reader = threading.Thread(target=items.extend, args=(streams[1],), daemon=True)
+    reader.start()
+    reader.join(10.)
+    assert not reader.is_alive()
+    assert items == list(range(len(items)))
+    assert len(items) < 100
+
+
+def test_failing_encoder_fails_the_job(tmp_path):
+    # _compare_videos' layout: two encoders on their own threads, the caller reading the third
+    # stream, an encoder that can't write its output must fail the job instead of hanging it
+    def compare(job, out_dir):
+        streams = pipeline.split(((f, f, i) for i, f in enumerate(_frames(200))), 3, maxsize=2)
+        with ThreadPoolExecutor(max_workers=2) as encoders:
+            encoded1 = encoders.submit(video_io.encode, streams[0], os.path.join(out_dir, 'out1.mp4'), 10)
+            encoded2 = encoders.submit(video_io.encode, streams[1], str(tmp_path / 'out2.mp4'), 10)
+            read = list(streams[2])
+            encoded1.result()
+            encoded2.result()
+        return len(read)
+
+    job_queue = jobs.JobQueue(state_dir=str(tmp_path / 'jobs'))
+    state = _wait(job_queue, job_queue.submit(compare, str(tmp_path / 'missing' / 'dir')).id)
+    assert state['status'] == jobs.FAILED
+    assert state['error']
+    # and the queue's only worker is free for the next job
+    state = _wait(job_queue, job_queue.submit(compare, str(tmp_path)).id)
+    assert state['status'] == jobs.DONE
+    assert state['result'] == 200
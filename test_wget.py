@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+from posenet.converter import wget
+
+CHECKPOINT = 'mobilenet_v1_101'
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    # a file:// mirror laid out like the bucket: one manifest and the two weight files it lists
+    root = tmp_path / 'mirror'
+    (root / CHECKPOINT).mkdir(parents=True)
+    manifest = {'a': {'filename': 'group1-shard1of1', 'shape': [2, 3]},
+                'b': {'filename': 'group2-shard1of1', 'shape': [5]}}
+    (root / CHECKPOINT / 'manifest.json').write_text(json.dumps(manifest))
+    files = {'group1-shard1of1': os.urandom(24), 'group2-shard1of1': os.urandom(20)}
+    for name, data in files.items():
+        (root / CHECKPOINT / name).write_bytes(data)
+    return root, files
+
+
+def _checksums(root, files):
+    with open(str(root / CHECKPOINT / wget.CHECKSUMS_FILE), 'w') as f:
+        for name, data in files.items():
+            f.write('%s  %s\n' % (hashlib.sha256(data).hexdigest(), name))
+
+
+def test_download_from_file_mirror(tmp_path, mirror):
+    root, files = mirror
+    _checksums(root, files)
+    base_dir = str(tmp_path / 'weights')
+    assert wget.download(CHECKPOINT, base_dir, mirror=root.as_uri(), workers=2) == 44
+    for name, data in files.items():
+        with open(os.path.join(base_dir, CHECKPOINT, name), 'rb') as f:
+            assert f.read() == data
+    # everything is in place: nothing is fetched again
+    assert wget.download(CHECKPOINT, base_dir, mirror=root.as_uri()) == 0
+
+
+def test_download_resumes_from_part_file(tmp_path, mirror):
+    root, files = mirror
+    _checksums(root, files)
+    save_dir = tmp_path / 'weights' / CHECKPOINT
+    save_dir.mkdir(parents=True)
+    (save_dir / 'manifest.json').write_bytes((root / CHECKPOINT / 'manifest.json').read_bytes())
+    (save_dir / 'group1-shard1of1').write_bytes(files['group1-shard1of1'])
+    # an interrupted download: only the rest of the file is requested
+    (save_dir / 'group2-shard1of1.part').write_bytes(files['group2-shard1of1'][:8])
+
+    assert wget.download(CHECKPOINT, str(tmp_path / 'weights'), mirror=root.as_uri()) == 12
+    assert (save_dir / 'group2-shard1of1').read_bytes() == files['group2-shard1of1']
+    assert not (save_dir / 'group2-shard1of1.part').exists()
+
+
+def test_download_rejects_sha256_mismatch(tmp_path, mirror):
+    root, files = mirror
+    _checksums(root, dict(files, **{'group2-shard1of1': b'something else'}))
+    save_dir = tmp_path / 'weights' / CHECKPOINT
+    with pytest.raises(IOError, match='sha256 mismatch'):
+        wget.download(CHECKPOINT, str(tmp_path / 'weights'), mirror=root.as_uri())
+    # the bad file is neither put in place nor kept for resuming
+    assert not (save_dir / 'group2-shard1of1').exists()
+    assert not (save_dir / 'group2-shard1of1.part').exists()
+    assert (save_dir / 'group1-shard1of1').read_bytes() == files['group1-shard1of1']
@@ -0,0 +1,114 @@
+import subprocess
+
+import imageio
+import imageio_ffmpeg
+import numpy as np
+
+import pipeline
+
+
+def open_reader(path, fps=None):
+    """Opens a video for sequential decoding, optionally resampled to `fps`.
+
+    Resampling happens inside ffmpeg: frames it drops are never converted to RGB or piped to
+    Python, let alone run through PoseNet.
+    """
+    if fps is None:
+        return imageio.get_reader(path, 'ffmpeg')
+    return imageio.get_reader(path, 'ffmpeg', fps=fps)
+
+
+def open_pair(path1, path2, max_fps=None):
+    """Opens two videos at a common frame rate so frame i of one is the same moment as frame i
+    of the other. Returns `(reader1, reader2, fps)`.
+
+    The common rate is the lower native rate (capped at `max_fps`): the faster video is thinned
+    out rather than the slower one padded with duplicated frames, so no pose has to be invented.
+    """
+    readers = [open_reader(path1), open_reader(path2)]
+    rates = [r.get_meta_data()['fps'] for r in readers]
+    fps = min(rates + ([max_fps] if max_fps else []))
+    for i, (path, rate) in enumerate(zip((path1, path2), rates)):
+        if abs(rate - fps) > 1e-3:
+            readers[i].close()
+            readers[i] = open_reader(path, fps)
+    return readers[0], readers[1], fps
+
+
+def paired_frames(video_r, video_r2, threaded=False, maxsize=8):
+    """Decodes two readers sequentially in lockstep and yields `(frame1, frame2)` pairs.
+
+    Both readers are iterated front to back (no `get_data(i)` seeks), and iteration stops at
+    the end of the shorter video. With `threaded=True` each reader decodes on its own thread.
+    """
+    frames1 = iter(video_r)
+    frames2 = iter(video_r2)
+    if threaded:
+        frames1 = pipeline.buffered(frames1, maxsize)
+        frames2 = pipeline.buffered(frames2, maxsize)
+    try:
+        for pair in zip(frames1, frames2):
+            yield pair
+    finally:
+        if threaded:
+            frames1.close()
+            frames2.close()
+
+
+def encode(frames, path, fps):
+    """Streams RGB frames straight into a browser-playable H.264 MP4 at `fps`.
+
+    Frames are piped to a single ffmpeg process through imageio-ffmpeg, so each frame is
+    encoded exactly once and nothing is buffered beyond the pipe. `frames` is closed however
+    encoding ends, so a failing encoder releases a `pipeline.split` producer feeding it.
+    """
+    count = 0
+    try:
+        writer = imageio.get_writer(
+            path, format='FFMPEG', mode='I', fps=fps, codec='libx264', pixelformat='yuv420p',
+            # yuv420p only needs even dimensions; the default of 16 would rescale most phone videos
+            macro_block_size=2,
+            ffmpeg_params=['-movflags', '+faststart'])
+        try:
+            for frame in frames:
+                writer.append_data(frame)
+                count += 1
+        finally:
+            writer.close()
+    finally:
+        close = getattr(frames, 'close', None)
+        if close is not None:
+            close()
+    return count
+
+
+def audio_envelope(path, fps, sample_rate=16000):
+    """Per-video-frame onset strength of the audio track, or None if there is no audio.
+
+    The audio is decoded by ffmpeg to mono 16-bit PCM and streamed through a pipe one chunk at a
+    time; each frame's value is the rise in log RMS energy over the previous frame.
+    """
+    samples_per_frame = int(round(sample_rate / float(fps)))
+    cmd = [imageio_ffmpeg.get_ffmpeg_exe(), '-v', 'error', '-i', path, '-vn', '-ac', '1',
+           '-ar', str(sample_rate), '-f', 's16le', '-']
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    frame_bytes = 2 * samples_per_frame
+    energy = []
+    pending = b''
+    try:
+        while True:
+            chunk = proc.stdout.read(frame_bytes * 256)
+            if not chunk:
+                break
+            pending += chunk
+            usable = len(pending) // frame_bytes * frame_bytes
+            samples = np.frombuffer(pending[:usable], dtype=np.int16).astype(np.float32)
+            pending = pending[usable:]
+            energy.append(np.sqrt(np.mean(samples.reshape(-1, samples_per_frame) ** 2, axis=1)))
+    finally:
+        proc.stdout.close()
+        proc.wait()
+    if not energy or not np.concatenate(energy).any():
+        return None
+    log_energy = np.log(np.concatenate(energy) + 1.)
+    return np.maximum(np.diff(log_energy, prepend=log_energy[0]), 0.)